@@ -2,17 +2,32 @@ import json
 import boto3
 from urllib import request
 import os
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from boto3.s3.transfer import TransferConfig
 
-region_name = boto3.Session().region_name
-ssm_client = boto3.client("ssm",region_name=region_name)
-genai_s3_bucket = ssm_client.get_parameter(Name="genai_s3_bucket")["Parameter"]["Value"]
-genai_kendra_index_id = ssm_client.get_parameter(Name="genai_kendra_index_id")["Parameter"]["Value"]
-genai_s3_data_source_id = ssm_client.get_parameter(Name="genai_s3_data_source_id")["Parameter"]["Value"]
+import config
+from ingest_manifest import IngestManifest, HashingReader
+from document_metadata import document_attributes, write_sidecar
 
-seed_documents = ["https://docs.aws.amazon.com/autoscaling/ec2/userguide/as-dg.pdf",
-                  "https://docs.aws.amazon.com/AmazonS3/latest/userguide/s3-userguide.pdf",
-                  "https://docs.aws.amazon.com/vpc/latest/userguide/vpc-ug.pdf",
-                  "https://docs.aws.amazon.com/lambda/latest/dg/lambda-dg.pdf"]
+parameters = config.get_parameters()
+genai_s3_bucket = parameters["genai_s3_bucket"]
+genai_kendra_index_id = parameters["genai_kendra_index_id"]
+genai_s3_data_source_id = parameters["genai_s3_data_source_id"]
+
+#List of {"url", "key", "category"} to bootstrap, bundled with the function or read from s3://bucket/key
+SEED_MANIFEST = os.environ.get("SEED_MANIFEST", os.path.join(os.path.dirname(os.path.abspath(__file__)), "seed_manifest.json"))
+#Documents downloaded at the same time, each one streamed into a multipart upload
+SEED_WORKERS = int(os.environ.get("SEED_WORKERS", "8"))
+DOWNLOAD_TIMEOUT = 30
+#No new download is started with less time left in the invocation
+MIN_REMAINING_MILLIS = 60000
+#Parts are held in memory only, so concurrency x workers x chunk size stays well under the function memory
+TRANSFER_CONFIG = TransferConfig(multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024, max_concurrency=4)
+
+documents_folder = 'Documents'
+metadata_folder = 'Metadata'
 
 def s3_folder_exists(bucket:str, path:str) -> bool:
     '''
@@ -25,6 +40,93 @@ def s3_folder_exists(bucket:str, path:str) -> bool:
     return 'CommonPrefixes' in resp
 
 
+def load_manifest(location=SEED_MANIFEST):
+    '''
+    Returns the seed documents of a manifest file, {"documents": [{"url", "key", "category"}]}.
+    The key defaults to Documents/<file name of the URL>.
+    '''
+    if location.startswith("s3://"):
+        bucket, key = location[5:].split("/", 1)
+        manifest = json.load(boto3.client('s3').get_object(Bucket=bucket, Key=key)["Body"])
+    else:
+        with open(location) as f:
+            manifest = json.load(f)
+    documents = []
+    for document in manifest["documents"]:
+        if isinstance(document, str):
+            document = {"url": document}
+        key = document.get("key") or documents_folder + "/" + document["url"].split("?")[0].split("/")[-1]
+        documents.append({"url": document["url"], "key": key, "category": document.get("category")})
+    return documents
+
+
+def is_current(s3, bucket:str, key:str, etag, content_length) -> bool:
+    '''
+    True when the object was uploaded from the same version of the document,
+    by the origin ETag recorded at upload or, without one, by its size.
+    '''
+    try:
+        head = s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    source_etag = head.get("Metadata", {}).get("source-etag")
+    if etag and source_etag:
+        return source_etag == etag
+    return content_length is not None and head["ContentLength"] == content_length
+
+
+def copy_document(s3, bucket:str, document:dict, manifest=None) -> str:
+    '''
+    Streams one document from its URL into S3 without writing it to disk.
+    The download is dropped after the response headers when the object is current,
+    otherwise its content hash is recorded in the ingestion manifest.
+    '''
+    with request.urlopen(document["url"], timeout=DOWNLOAD_TIMEOUT) as response:
+        etag = response.headers.get("ETag")
+        length = response.headers.get("Content-Length")
+        content_length = int(length) if length is not None else None
+        if is_current(s3, bucket, document["key"], etag, content_length):
+            if manifest is not None:
+                manifest.record_skip(content_length or 0)
+            return "skipped"
+        extra_args = {
+            "ContentType": response.headers.get("Content-Type", "application/octet-stream"),
+            "Metadata": {"source-url": document["url"], "source-etag": etag or ""}
+        }
+        reader = HashingReader(response)
+        s3.upload_fileobj(reader, bucket, document["key"], ExtraArgs=extra_args, Config=TRANSFER_CONFIG)
+    file_name = document["key"].split("/")[-1]
+    write_sidecar(s3, bucket, document["key"], "s3://" + bucket + "/" + document["key"], file_name, None,
+                  document_attributes(file_name, reader.size, category=document.get("category")))
+    if manifest is not None:
+        manifest.record_upload(document["key"], reader.hexdigest(), reader.size)
+    return "uploaded"
+
+
+def bootstrap(s3, bucket:str, documents:list, workers:int=SEED_WORKERS, context=None, manifest=None) -> dict:
+    '''
+    Copies the documents with a bounded pool of workers. Documents not started
+    before the invocation gets close to its timeout are reported as pending.
+    '''
+    results = {}
+
+    def run(document):
+        if context is not None and context.get_remaining_time_in_millis() < MIN_REMAINING_MILLIS:
+            return "pending"
+        try:
+            return copy_document(s3, bucket, document, manifest)
+        except Exception as e:
+            print("Failed to copy", document["url"], e)
+            return "failed"
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for document, status in zip(documents, executor.map(run, documents)):
+            results[document["key"]] = status
+    return results
+
+
 def lambda_handler(event, context):
     
     print("Kendra boostrap function started")
@@ -32,33 +134,36 @@ def lambda_handler(event, context):
     print("Kendra Index_ID: ", genai_kendra_index_id)
     print("Data Source ID: ", genai_s3_data_source_id)
     
-    s3 = boto3.client('s3')
-    documents_folder = 'Documents'
-    metadata_folder = 'Metadata'
+    s3 = boto3.client('s3', config=Config(max_pool_connections=SEED_WORKERS * TRANSFER_CONFIG.max_request_concurrency))
     
     if not s3_folder_exists(genai_s3_bucket,documents_folder):
         s3.put_object(Bucket=genai_s3_bucket, Key=(documents_folder+'/'))
     
     if not s3_folder_exists(genai_s3_bucket,metadata_folder):
         s3.put_object(Bucket=genai_s3_bucket, Key=(metadata_folder+'/'))
-        
-    for document in seed_documents:
-        
-        file_name = document.split("/")[-1]
-        local_file = "/tmp/"+file_name
-        request.urlretrieve(document, local_file)
-        
-        s3.upload_file(local_file, genai_s3_bucket, documents_folder+"/"+file_name)
-        os.remove(local_file)
-        
-    kendra = boto3.client("kendra")
-    
-    sync_response = kendra.start_data_source_sync_job(
-        Id = genai_s3_data_source_id,
-        IndexId = genai_kendra_index_id
-    )
 
-    print(sync_response)    
+    seed_documents = load_manifest((event or {}).get("manifest", SEED_MANIFEST))
+    ingest_manifest = IngestManifest(s3, genai_s3_bucket).load()
+    results = bootstrap(s3, genai_s3_bucket, seed_documents, context=context, manifest=ingest_manifest)
+    counts = {status: list(results.values()).count(status) for status in set(results.values())}
+    print("Seed documents:", counts)
+
+    #Documents uploaded by an earlier invocation that did not reach the sync are still pending
+    if ingest_manifest.pending():
+        kendra = boto3.client("kendra")
+
+        sync_response = kendra.start_data_source_sync_job(
+            Id = genai_s3_data_source_id,
+            IndexId = genai_kendra_index_id
+        )
+
+        print(sync_response)
+        #The web application marks the documents indexed once this job SUCCEEDED
+        ingest_manifest.assign_job(sync_response["ExecutionId"])
+    else:
+        ingest_manifest.count("sync_jobs_avoided")
+        print("Seed documents unchanged, no sync needed")
+    ingest_manifest.save()
 
     return {
         "statusCode": 200,
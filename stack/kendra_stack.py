@@ -1,3 +1,7 @@
+import os
+import shutil
+
+import jsii
 from aws_cdk import (
     Stack,
     aws_ec2 as ec2,
@@ -8,10 +12,30 @@ from aws_cdk import (
     aws_lambda as _lambda,
     triggers,
     RemovalPolicy,
-    Duration
+    Duration,
+    AssetHashType,
+    BundlingOptions,
+    ILocalBundling
 )
 from constructs import Construct
 
+BOOTSTRAP_LAMBDA_DIR = "lambda/bootstrap_kendra"
+#Modules of the web app also imported by the bootstrap Lambda, copied next to its handler when the asset is built
+SHARED_MODULES_DIR = "web-app/scripts"
+SHARED_MODULES = ["config.py", "ingest_manifest.py", "document_metadata.py"]
+
+@jsii.implements(ILocalBundling)
+class BootstrapLambdaBundling:
+    """
+    Builds the bootstrap Lambda asset without Docker: the handler folder plus the shared web app modules.
+    """
+
+    def try_bundle(self, output_dir, options):
+        shutil.copytree(BOOTSTRAP_LAMBDA_DIR, output_dir, dirs_exist_ok=True, ignore=shutil.ignore_patterns("__pycache__"))
+        for module in SHARED_MODULES:
+            shutil.copy(os.path.join(SHARED_MODULES_DIR, module), output_dir)
+        return True
+
 class KendraStack(Stack):
 
     def __init__(self, scope: Construct, construct_id: str, vpc: ec2.IVpc, **kwargs) -> None:
@@ -60,7 +84,7 @@ class KendraStack(Stack):
         lambda_role.attach_inline_policy(iam.Policy(self, "lambda-ssm-policy",
             statements=[iam.PolicyStatement(
             effect=iam.Effect.ALLOW,
-            actions = ["ssm:GetParameter"],
+            actions = ["ssm:GetParameter","ssm:GetParameters"],
             resources = ["arn:aws:ssm:*"],
             )]
         ))          
@@ -69,7 +93,13 @@ class KendraStack(Stack):
         kendra_cfn_index = kendra.CfnIndex(self, "MyKendraCfnIndex",
             edition="DEVELOPER_EDITION",
             name="genai-rag-index-cdk",
-            role_arn=role.role_arn)
+            role_arn=role.role_arn,
+            # Custom attribute written to the Metadata/ sidecars, returned with the Retrieve results
+            document_metadata_configurations=[kendra.CfnIndex.DocumentMetadataConfigurationProperty(
+                name="file_size",
+                type="LONG_VALUE",
+                search=kendra.CfnIndex.SearchProperty(displayable=True, facetable=False, searchable=False, sortable=True)
+            )])
         
         # Create Kendra data source
         s3_cfn_data_source = kendra.CfnDataSource(self, "MyS3CfnDataSource",
@@ -92,7 +122,16 @@ class KendraStack(Stack):
         kendra_bootstrap = _lambda.Function(
             self, "kendra_bootstrap",
             runtime=_lambda.Runtime.PYTHON_3_9,
-            code=_lambda.Code.from_asset("lambda/bootstrap_kendra"),
+            code=_lambda.Code.from_asset(
+                ".",
+                asset_hash_type=AssetHashType.OUTPUT,
+                bundling=BundlingOptions(
+                    local=BootstrapLambdaBundling(),
+                    image=_lambda.Runtime.PYTHON_3_9.bundling_image,
+                    command=["bash", "-c", f"cp -r {BOOTSTRAP_LAMBDA_DIR}/. /asset-output/ && "
+                             + " ".join(["cp"] + [f"{SHARED_MODULES_DIR}/{m}" for m in SHARED_MODULES] + ["/asset-output/"])]
+                )
+            ),
             handler="init_kendra.lambda_handler",
             role=lambda_role,
             timeout=Duration.minutes(10),
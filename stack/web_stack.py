@@ -41,12 +41,16 @@ class WebStack(Stack):
                 container_port=8501,
                 ),
             memory_limit_mib=4096,      # Default is 512
-            public_load_balancer=True)  # Default is True
+            public_load_balancer=True,  # Default is True
+            # The container warms up before opening its port
+            health_check_grace_period=Duration.seconds(180))
+
+        fargate_service.target_group.configure_health_check(path="/_stcore/health")
 
 
         fargate_service.task_definition.add_to_task_role_policy(iam.PolicyStatement(
             effect=iam.Effect.ALLOW,
-            actions = ["ssm:GetParameter"],
+            actions = ["ssm:GetParameter","ssm:GetParameters"],
             resources = ["arn:aws:ssm:*"],
             )
         )  
@@ -88,4 +92,33 @@ class WebStack(Stack):
             target_utilization_percent=50,
             scale_in_cooldown=Duration.seconds(60),
             scale_out_cooldown=Duration.seconds(60),
+        )
+
+        # Headless API of the same image, sharing the task role of the web application
+        api_service = ecs_patterns.ApplicationLoadBalancedFargateService(
+            self, "ApiService",
+            cluster=cluster,
+            cpu=2048,
+            desired_count=1,
+            task_image_options=ecs_patterns.ApplicationLoadBalancedTaskImageOptions(
+                image=image,
+                container_port=8080,
+                command=["python", "-m", "uvicorn", "scripts.api_server:app", "--host", "0.0.0.0", "--port", "8080"],
+                task_role=fargate_service.task_definition.task_role,
+                ),
+            memory_limit_mib=4096,
+            # Internal systems only: the API has no authentication and every question spends Bedrock tokens
+            public_load_balancer=False,
+            health_check_grace_period=Duration.seconds(180))
+
+        api_service.target_group.configure_health_check(path="/health")
+
+        api_scaling = api_service.service.auto_scale_task_count(
+            max_capacity=10
+        )
+        api_scaling.scale_on_cpu_utilization(
+            "ApiCpuScaling",
+            target_utilization_percent=50,
+            scale_in_cooldown=Duration.seconds(60),
+            scale_out_cooldown=Duration.seconds(60),
         )
\ No newline at end of file
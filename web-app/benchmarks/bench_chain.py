@@ -0,0 +1,216 @@
+"""
+Offline benchmark of the RAG chain with stubbed Bedrock and Kendra clients.
+
+Run from the web-app folder:
+
+    python -m benchmarks.bench_chain --concurrency 8
+    python -m benchmarks.bench_chain --record-baseline
+    python -m benchmarks.bench_chain --async-pipeline --kendra-latency 0.5
+
+Results are compared with benchmarks/baseline.json when it exists.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+#The chain modules read their configuration at import time
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("GENAI_KENDRA_INDEX_ID", "benchmark-index")
+os.environ.setdefault("GENAI_S3_DATA_SOURCE_ID", "benchmark-data-source")
+os.environ.setdefault("GENAI_S3_BUCKET", "benchmark-bucket")
+os.environ.setdefault("GENAI_ANSWER_CACHE", "off")
+
+from benchmarks.fakes import FakeKendra, FakeBedrock
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_QUESTIONS = os.path.join(BENCHMARK_DIR, "questions.jsonl")
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return round(values[index], 4)
+
+
+def load_questions(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def ask(chain_module, chain, item, stream):
+    history = [tuple(turn) for turn in item.get("history", [])]
+    start_time = time.time()
+    first_token = None
+    tokens = 0
+    degraded = False
+    try:
+        if stream:
+            for result in chain_module.run_chain_stream(chain, item["question"], history):
+                if "token" in result:
+                    tokens += 1
+                    if first_token is None:
+                        first_token = time.time() - start_time
+                degraded = result.get("degraded", False)
+        else:
+            result = chain_module.run_chain(chain, item["question"], history)
+            tokens = len(result["answer"].split())
+            degraded = result.get("degraded", False)
+    except Exception as e:
+        return {"error": type(e).__name__}
+
+    latency = time.time() - start_time
+    first_token = latency if first_token is None else first_token
+    generation = latency - first_token
+    return {
+        "latency": latency,
+        "ttft": first_token,
+        "tokens_per_second": tokens / generation if generation > 0 else None,
+        "degraded": degraded
+    }
+
+
+async def ask_all_async(pipeline, chain, questions, concurrency):
+    """
+    Answers the questions with scripts.async_pipeline.run_chain_async, at most
+    concurrency at a time on one event loop.
+    """
+    slots = asyncio.Semaphore(concurrency)
+
+    async def ask_async(item):
+        history = [tuple(turn) for turn in item.get("history", [])]
+        async with slots:
+            start_time = time.time()
+            try:
+                result = await pipeline.run_chain_async(chain, item["question"], history)
+            except Exception as e:
+                return {"error": type(e).__name__}
+            latency = time.time() - start_time
+            return {"latency": latency, "ttft": latency, "tokens_per_second": None, "degraded": result.get("degraded", False)}
+
+    return await asyncio.gather(*(ask_async(item) for item in questions))
+
+
+def run(args):
+    from scripts import clients
+    kendra = FakeKendra(latency=args.kendra_latency, error_rate=args.error_rate)
+    bedrock = FakeBedrock(first_token_latency=args.first_token_latency,
+                          tokens_per_second=args.tokens_per_second,
+                          error_rate=args.error_rate)
+    clients.set_client("kendra", kendra)
+    clients.set_client("bedrock-runtime", bedrock)
+
+    import scripts.kendra_chat_bedrock_claudev2 as bedrock_claudev2
+    from scripts import router
+    chain = bedrock_claudev2.build_chain()
+    chain.verbose = False
+    chain.combine_docs_chain.verbose = False
+    chain.question_generator.verbose = False
+
+    questions = load_questions(args.questions) * args.repeat
+    start_time = time.time()
+    if args.async_pipeline:
+        from scripts import async_pipeline
+        results = asyncio.run(ask_all_async(async_pipeline, chain, questions, args.concurrency))
+    else:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(lambda q: ask(bedrock_claudev2, chain, q, not args.no_stream), questions))
+    wall_time = time.time() - start_time
+
+    ok = [r for r in results if "error" not in r]
+    latencies = [r["latency"] for r in ok]
+    ttfts = [r["ttft"] for r in ok]
+    rates = [r["tokens_per_second"] for r in ok if r["tokens_per_second"]]
+    report = {
+        "config": {
+            "questions": len(questions),
+            "concurrency": args.concurrency,
+            "stream": not args.no_stream,
+            "kendra_latency": args.kendra_latency,
+            "first_token_latency": args.first_token_latency,
+            "tokens_per_second": args.tokens_per_second,
+            "error_rate": args.error_rate
+        },
+        "results": {
+            "errors": len(results) - len(ok),
+            "degraded": sum(1 for r in ok if r["degraded"]),
+            "throughput_qps": round(len(ok) / wall_time, 3),
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "latency_p99": percentile(latencies, 99),
+            "ttft_p50": percentile(ttfts, 50),
+            "ttft_p95": percentile(ttfts, 95),
+            "tokens_per_second_p50": percentile(rates, 50),
+            "llm_calls_per_question": round(bedrock.calls / len(questions), 3),
+            "kendra_calls_per_question": round(kendra.calls / len(questions), 3)
+        },
+        "routes": router.stats.snapshot()
+    }
+    if args.async_pipeline:
+        #Not part of the default configuration, so the recorded baseline still applies to default runs
+        report["config"]["async_pipeline"] = True
+        report["pipeline"] = {**async_pipeline.pipeline_latency.summary(), **async_pipeline.stats,
+                              "kendra": async_pipeline.kendra_latency.summary()}
+    return report
+
+
+def compare(report, baseline, max_regression):
+    """
+    Prints the change of every latency metric against the baseline and
+    returns False when one got worse by more than max_regression.
+    """
+    ok = True
+    for name, value in report["results"].items():
+        base = baseline["results"].get(name)
+        if value is None or not base:
+            continue
+        change = (value - base) / base
+        flag = ""
+        if (name.startswith("latency") or name.startswith("ttft")) and change > max_regression:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"{name:28} {base:>10} -> {value:>10} ({change:+.1%}){flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the RAG chain")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="JSONL file of {question, history}")
+    parser.add_argument("--repeat", type=int, default=1, help="times the question set is replayed")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--no-stream", action="store_true", help="use run_chain instead of run_chain_stream")
+    parser.add_argument("--async-pipeline", action="store_true", help="use async_pipeline.run_chain_async (hedged Kendra calls)")
+    parser.add_argument("--kendra-latency", type=float, default=0.2, help="seconds per Retrieve")
+    parser.add_argument("--first-token-latency", type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of throttled calls")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--record-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed latency increase vs baseline")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+
+    if args.record_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["config"] != report["config"]:
+            print("Benchmark configuration differs from the baseline, comparison skipped")
+        elif not compare(report, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
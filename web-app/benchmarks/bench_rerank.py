@@ -0,0 +1,129 @@
+"""
+Offline recall@k benchmark of the re-ranker on a labeled question set.
+
+Run from the web-app folder:
+
+    python -m benchmarks.bench_rerank
+    python -m benchmarks.bench_rerank --scorer cross-encoder --model-dir models/ms-marco-MiniLM-L-6-v2
+    python -m benchmarks.bench_rerank --live     # candidates from the Kendra index instead of the stored ones
+
+Each question lists its relevant passages as {"title", "contains"} and, for the
+offline mode, the IDs of its candidate passages.
+
+The stored candidates and their order are synthetic: they were written by hand
+to resemble a noisy first-stage ranking, with confidence buckets assigned by
+position. Offline results show that the re-ranker works, not how it compares
+with Kendra. Only --live measures against Kendra's actual order.
+"""
+import json
+import time
+import os
+import sys
+import argparse
+
+from langchain.schema import Document
+
+from scripts import reranker
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_QUESTIONS = os.path.join(BENCHMARK_DIR, "rerank_questions.jsonl")
+DEFAULT_PASSAGES = os.path.join(BENCHMARK_DIR, "rerank_passages.jsonl")
+K_VALUES = (1, 3, 5)
+
+
+def load_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def synthetic_score(position):
+    #Stand-in confidence buckets for the hand-ordered candidates
+    return "HIGH" if position < 2 else "MEDIUM" if position < 6 else "LOW"
+
+
+def stored_candidates(item, passages):
+    return [
+        Document(page_content=passages[pid]["text"], metadata={"title": passages[pid]["title"], "score": synthetic_score(i)})
+        for i, pid in enumerate(item["candidates"])
+    ]
+
+
+def live_retriever(top_k):
+    from langchain.retrievers import AmazonKendraRetriever
+    from scripts import clients, config
+    return AmazonKendraRetriever(index_id=config.get_parameter("genai_kendra_index_id"), top_k=top_k,
+                                 client=clients.get_client("kendra"))
+
+
+def is_relevant(document, label):
+    return (document.metadata.get("title") == label["title"]
+            and label["contains"].lower() in document.page_content.lower())
+
+
+def recall_at(documents, labels, k):
+    found = sum(1 for label in labels if any(is_relevant(d, label) for d in documents[:k]))
+    return found / len(labels)
+
+
+def reciprocal_rank(documents, labels):
+    for i, d in enumerate(documents):
+        if any(is_relevant(d, label) for label in labels):
+            return 1 / (i + 1)
+    return 0.0
+
+
+def evaluate(items, candidates_of, rankers):
+    totals = {name: {f"recall@{k}": 0.0 for k in K_VALUES} | {"mrr": 0.0, "ms": []} for name in rankers}
+    for item in items:
+        candidates = candidates_of(item)
+        for name, rank in rankers.items():
+            start_time = time.perf_counter()
+            ranked = rank(item["question"], candidates)
+            totals[name]["ms"].append((time.perf_counter() - start_time) * 1000)
+            for k in K_VALUES:
+                totals[name][f"recall@{k}"] += recall_at(ranked, item["relevant"], k)
+            totals[name]["mrr"] += reciprocal_rank(ranked, item["relevant"])
+
+    report = {}
+    for name, values in totals.items():
+        timings = sorted(values.pop("ms"))
+        report[name] = {metric: round(value / len(items), 3) for metric, value in values.items()}
+        report[name]["rerank_ms_p50"] = round(timings[len(timings) // 2], 3)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k of the re-ranker against the first-stage order")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--passages", default=DEFAULT_PASSAGES)
+    parser.add_argument("--scorer", choices=["bm25", "cross-encoder"], default="bm25")
+    parser.add_argument("--model-dir", default=reranker.RERANKER_MODEL, help="cross-encoder folder (model.onnx, tokenizer.json)")
+    parser.add_argument("--live", action="store_true", help="retrieve the candidates from the Kendra index")
+    parser.add_argument("--candidates", type=int, default=reranker.RERANK_CANDIDATES, help="Kendra top_k in live mode")
+    parser.add_argument("--fail-under", type=float, help="exit with an error when the re-ranked recall@5 is lower")
+    args = parser.parse_args()
+
+    items = load_jsonl(args.questions)
+    if args.live:
+        retriever = live_retriever(args.candidates)
+        candidates_of = lambda item: retriever.invoke(item["question"])
+    else:
+        passages = {p["id"]: p for p in load_jsonl(args.passages)}
+        candidates_of = lambda item: stored_candidates(item, passages)
+
+    scorer = reranker.get_scorer(args.scorer, args.model_dir)
+    baseline = "kendra" if args.live else "synthetic_order"
+    rankers = {
+        baseline: lambda question, documents: documents,
+        args.scorer: lambda question, documents: reranker.rerank(question, documents, len(documents), scorer)
+    }
+    report = evaluate(items, candidates_of, rankers)
+    candidates = "live Kendra results" if args.live else "synthetic, hand-ordered candidates (not a Kendra measurement)"
+    print(json.dumps({"questions": len(items), "candidates": candidates, "results": report}, indent=2))
+
+    if args.fail_under is not None and report[args.scorer]["recall@5"] < args.fail_under:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
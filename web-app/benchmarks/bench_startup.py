@@ -0,0 +1,158 @@
+"""
+Cold start benchmark of the web-app process with stubbed Bedrock and Kendra clients.
+
+Run from the web-app folder:
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 5 --connect-latency 0.3
+
+Every measure is taken in a fresh interpreter:
+- imports: time to import the modules of each page
+- cold: the process starts Streamlit right away and the first question pays
+  for the imports, the chain and the new connections
+- warm: the process runs scripts.warmup before it starts accepting requests
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import statistics
+
+#The chain modules read their configuration at import time
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("GENAI_KENDRA_INDEX_ID", "benchmark-index")
+os.environ.setdefault("GENAI_S3_DATA_SOURCE_ID", "benchmark-data-source")
+os.environ.setdefault("GENAI_S3_BUCKET", "benchmark-bucket")
+os.environ.setdefault("GENAI_ANSWER_CACHE", "off")
+
+WEB_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUESTIONS = ["What is S3 Versioning?", "How long can a Lambda function run?"]
+
+#Modules imported by each page, see the imports at the top of Home.py and pages/
+PAGE_MODULES = {
+    "home": ["streamlit"],
+    "documents_list": ["streamlit", "scripts.clients", "scripts.config", "scripts.catalog",
+                       "scripts.instrumentation", "scripts.trace_panel"],
+    "rag": ["streamlit", "scripts.kendra_chat_bedrock_claudev2", "scripts.sources", "scripts.history",
+            "scripts.instrumentation", "scripts.router", "scripts.document_metadata", "scripts.warmup",
+            "scripts.trace_panel", "scripts.session_metrics"]
+}
+
+
+def measure_imports(page):
+    import importlib
+    start_time = time.perf_counter()
+    for module in PAGE_MODULES[page]:
+        importlib.import_module(module)
+    return {"seconds": time.perf_counter() - start_time, "langchain": "langchain" in sys.modules}
+
+
+def ask(question):
+    """
+    One question as the RAG page answers it. Returns the time to the first
+    token and to the answer.
+    """
+    import importlib
+    start_time = time.perf_counter()
+    for module in PAGE_MODULES["rag"]:
+        importlib.import_module(module)
+    from scripts import warmup
+    bedrock_claudev2 = importlib.import_module("scripts.kendra_chat_bedrock_claudev2")
+    chain = warmup.get_chain()
+    first_token = None
+    for result in bedrock_claudev2.run_chain_stream(chain, question, []):
+        if "token" in result and first_token is None:
+            first_token = time.perf_counter() - start_time
+    return {"first_token_seconds": first_token, "seconds": time.perf_counter() - start_time}
+
+
+def measure_start(warm, kendra_latency, first_token_latency, connect_latency):
+    from benchmarks.fakes import FakeKendra, FakeBedrock
+    from scripts import clients
+    kendra = FakeKendra(latency=kendra_latency, connect_latency=connect_latency)
+    bedrock = FakeBedrock(first_token_latency=first_token_latency, connect_latency=connect_latency)
+    clients.set_client("kendra", kendra)
+    clients.set_client("bedrock-runtime", bedrock)
+
+    start_time = time.perf_counter()
+    import streamlit
+    stages = {}
+    if warm:
+        from scripts import warmup
+        stages = {name: round(values["seconds"], 3) for name, values in warmup.warm_up().stages.items()}
+    startup = time.perf_counter() - start_time
+
+    first = ask(QUESTIONS[0])
+    second = ask(QUESTIONS[1])
+    return {
+        "startup_seconds": startup,
+        "first_token_seconds": first["first_token_seconds"],
+        "first_request_seconds": first["seconds"],
+        "second_request_seconds": second["seconds"],
+        "connections": kendra.pool.opened + bedrock.pool.opened,
+        "warmup_stages": stages
+    }
+
+
+def child(args):
+    """
+    Runs one measure in a fresh interpreter and returns its JSON result.
+    """
+    command = [sys.executable, "-m", "benchmarks.bench_startup", "--child", *args]
+    output = subprocess.run(command, cwd=WEB_APP_DIR, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def median_of(runs):
+    result = {}
+    for name, value in runs[0].items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            result[name] = round(statistics.median(r[name] for r in runs), 3)
+        else:
+            result[name] = value
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark of the web-app process")
+    parser.add_argument("--runs", type=int, default=3, help="fresh processes per measure, the median is reported")
+    parser.add_argument("--kendra-latency", type=float, default=0.2, help="seconds per Retrieve")
+    parser.add_argument("--first-token-latency", type=float, default=0.5, help="seconds before the first token")
+    parser.add_argument("--connect-latency", type=float, default=0.15, help="seconds to open a new connection")
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        kind = args.child[0]
+        if kind == "imports":
+            result = measure_imports(args.child[1])
+        else:
+            result = measure_start(kind == "warm", args.kendra_latency, args.first_token_latency, args.connect_latency)
+        print(json.dumps(result))
+        return
+
+    latencies = ["--kendra-latency", str(args.kendra_latency), "--first-token-latency", str(args.first_token_latency),
+                 "--connect-latency", str(args.connect_latency)]
+    report = {
+        "config": {
+            "runs": args.runs,
+            "kendra_latency": args.kendra_latency,
+            "first_token_latency": args.first_token_latency,
+            "connect_latency": args.connect_latency
+        },
+        "imports": {page: median_of([child(["imports", page]) for _ in range(args.runs)]) for page in PAGE_MODULES},
+        "cold": median_of([child(["cold", *latencies]) for _ in range(args.runs)]),
+        "warm": median_of([child(["warm", *latencies]) for _ in range(args.runs)])
+    }
+    print(json.dumps(report, indent=2))
+
+    cold, warm = report["cold"], report["warm"]
+    print(f"first request    {cold['first_request_seconds']:>8} -> {warm['first_request_seconds']:>8} seconds with warm-up")
+    print(f"first token      {cold['first_token_seconds']:>8} -> {warm['first_token_seconds']:>8} seconds with warm-up")
+    print(f"ready to serve   {cold['startup_seconds']:>8} -> {warm['startup_seconds']:>8} seconds with warm-up")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import io
+import json
+import time
+import random
+import threading
+from botocore.exceptions import ClientError
+
+PASSAGES = [
+    ("as-dg.pdf", "Amazon EC2 Auto Scaling helps you ensure that you have the correct number of Amazon EC2 instances available to handle the load for your application. You create collections of EC2 instances, called Auto Scaling groups."),
+    ("as-dg.pdf", "A scaling policy instructs Amazon EC2 Auto Scaling to track a specific CloudWatch metric, and it defines what action to take when the associated CloudWatch alarm is in ALARM."),
+    ("s3-userguide.pdf", "Amazon Simple Storage Service (Amazon S3) is an object storage service that offers industry-leading scalability, data availability, security, and performance."),
+    ("s3-userguide.pdf", "S3 Versioning keeps multiple variants of an object in the same bucket. You can use versioning to preserve, retrieve, and restore every version of every object stored in your buckets."),
+    ("vpc-ug.pdf", "With Amazon Virtual Private Cloud (Amazon VPC), you can launch AWS resources in a logically isolated virtual network that you've defined."),
+    ("vpc-ug.pdf", "A NAT gateway is a Network Address Translation service. Instances in a private subnet can connect to services outside your VPC but external services cannot initiate a connection with those instances."),
+    ("lambda-dg.pdf", "Lambda is a compute service that lets you run code without provisioning or managing servers. Lambda runs your code on a high-availability compute infrastructure."),
+    ("lambda-dg.pdf", "The Lambda function timeout can be set up to 900 seconds. Memory can be configured between 128 MB and 10,240 MB.")
+]
+
+ANSWER = ("Based on the documents, the service provides managed, scalable infrastructure. "
+          "It can be configured through the console, the AWS CLI or the SDKs, and it integrates "
+          "with CloudWatch for monitoring. Refer to the user guide for limits and pricing details.")
+
+
+def throttling_error(operation):
+    return ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, operation)
+
+
+class ConnectionPool:
+    """
+    Simulated connection pool: a call that finds every open connection busy
+    opens a new one and pays connect_latency (TCP and TLS handshakes).
+    """
+
+    def __init__(self, connect_latency=0.0):
+        self.connect_latency = connect_latency
+        self.opened = 0
+        self.in_use = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.in_use += 1
+            connect = self.in_use > self.opened
+            if connect:
+                self.opened += 1
+        if connect:
+            time.sleep(self.connect_latency)
+
+    def release(self):
+        with self._lock:
+            self.in_use -= 1
+
+
+class FakeKendra:
+    """
+    Stand-in for the Kendra client answering Retrieve after a configurable latency.
+    """
+
+    def __init__(self, latency=0.2, jitter=0.05, error_rate=0.0, bucket="benchmark-bucket", region="us-east-1",
+                 connect_latency=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.bucket = bucket
+        self.region = region
+        self.calls = 0
+        self.pool = ConnectionPool(connect_latency)
+        self._lock = threading.Lock()
+
+    def retrieve(self, IndexId, QueryText, PageSize=10, **kwargs):
+        with self._lock:
+            self.calls += 1
+        self.pool.acquire()
+        try:
+            time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        finally:
+            self.pool.release()
+        if random.random() < self.error_rate:
+            raise throttling_error("Retrieve")
+
+        words = set(QueryText.lower().split())
+        ranked = sorted(PASSAGES, key=lambda p: -len(words & set(p[1].lower().split())))
+        items = []
+        for i, (title, content) in enumerate(ranked[:PageSize]):
+            items.append({
+                "Id": f"{i}",
+                "DocumentId": f"s3://{self.bucket}/Documents/{title}",
+                "DocumentTitle": title,
+                "Content": content,
+                "DocumentURI": f"https://s3.{self.region}.amazonaws.com/{self.bucket}/Documents/{title}",
+                "DocumentAttributes": [],
+                "ScoreAttributes": {"ScoreConfidence": "HIGH" if i < 2 else "MEDIUM"}
+            })
+        return {"QueryId": "benchmark", "ResultItems": items}
+
+    def list_data_source_sync_jobs(self, Id, IndexId, **kwargs):
+        return {"History": []}
+
+
+class FakeBedrock:
+    """
+    Stand-in for the bedrock-runtime client. Completions start after first_token_latency
+    and are then produced at tokens_per_second, with or without response streaming.
+    """
+
+    def __init__(self, first_token_latency=0.5, tokens_per_second=50, error_rate=0.0, answer=ANSWER, connect_latency=0.0):
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.tokens = answer.split(" ")
+        self.calls = 0
+        self.tokens_generated = 0
+        self.pool = ConnectionPool(connect_latency)
+        self._lock = threading.Lock()
+
+    def _start(self, operation):
+        with self._lock:
+            self.calls += 1
+        #The connection is held for the first token only, enough to count handshakes
+        self.pool.acquire()
+        try:
+            time.sleep(self.first_token_latency)
+        finally:
+            self.pool.release()
+        if random.random() < self.error_rate:
+            raise throttling_error(operation)
+
+    def _count(self, tokens):
+        with self._lock:
+            self.tokens_generated += tokens
+
+    def invoke_model(self, body, modelId, **kwargs):
+        self._start("InvokeModel")
+        tokens = self.tokens[:json.loads(body).get("max_tokens_to_sample", len(self.tokens))]
+        time.sleep(len(tokens) / self.tokens_per_second)
+        self._count(len(tokens))
+        completion = json.dumps({"completion": " ".join(tokens), "stop_reason": "stop_sequence"})
+        return {"body": io.BytesIO(completion.encode("utf-8"))}
+
+    def invoke_model_with_response_stream(self, body, modelId, **kwargs):
+        self._start("InvokeModelWithResponseStream")
+
+        def events():
+            for i, token in enumerate(self.tokens):
+                if i:
+                    time.sleep(1 / self.tokens_per_second)
+                self._count(1)
+                text = token if i == 0 else " " + token
+                yield {"chunk": {"bytes": json.dumps({"completion": text}).encode("utf-8")}}
+
+        return {"body": events()}
+
+
+class FakeS3:
+    """
+    In-memory stand-in for the S3 client calls of the manifest, the sidecars and the seed documents.
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def _missing(self, operation):
+        return ClientError({"Error": {"Code": "NoSuchKey", "Message": "Not Found"}}, operation)
+
+    def put_object(self, Bucket, Key, Body=b"", Metadata=None, **kwargs):
+        body = Body.encode("utf-8") if isinstance(Body, str) else bytes(Body)
+        with self._lock:
+            self.objects[(Bucket, Key)] = {"Body": body, "Metadata": Metadata or {}}
+        return {}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            stored = self.objects.get((Bucket, Key))
+        if stored is None:
+            raise self._missing("GetObject")
+        return {"Body": io.BytesIO(stored["Body"]), "ContentLength": len(stored["Body"])}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            stored = self.objects.get((Bucket, Key))
+        if stored is None:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        return {"ContentLength": len(stored["Body"]), "Metadata": stored["Metadata"]}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Config=None):
+        self.put_object(Bucket, Key, Fileobj.read(), Metadata=(ExtraArgs or {}).get("Metadata"))
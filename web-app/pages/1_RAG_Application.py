@@ -1,16 +1,23 @@
 import streamlit as st
 import uuid
 import sys
-import boto3
+import json
 import logging
-from botocore.exceptions import ClientError
 
 import scripts.kendra_chat_bedrock_claudev2 as bedrock_claudev2
+from scripts import sources as source_links
+from scripts.history import ChatHistory
+from scripts import instrumentation
+from scripts import router
+from scripts import condense
+from scripts import document_metadata
+from scripts import warmup
+from scripts.trace_panel import write_trace
+from scripts.session_metrics import SessionRegistry
 
 USER_ICON = "images/user-icon.png"
 AI_ICON = "images/ai-icon.png"
 BEDROCK_ICON = "images/bedrock.png"
-MAX_HISTORY_LENGTH = 5
 PROVIDER_MAP = {
     'openai': 'Open AI',
     'anthropic': 'Anthropic',
@@ -21,42 +28,6 @@ PROVIDER_MAP = {
 }
 
 
-#function to generate pre-signed URL
-def create_presigned_url(bucket_name, object_name, expiration=3600):
-    """Generate a presigned URL to share an S3 object
-
-    :param bucket_name: string
-    :param object_name: string
-    :param expiration: Time in seconds for the presigned URL to remain valid
-    :return: Presigned URL as string. If error, returns None.
-    """
-
-    # Generate a presigned URL for the S3 object
-    s3_client = boto3.client('s3')
-    try:
-        response = s3_client.generate_presigned_url('get_object',
-                                                    Params={'Bucket': bucket_name,
-                                                            'Key': object_name},
-                                                    ExpiresIn=expiration)
-    except ClientError as e:
-        logging.error(e)
-        return None
-
-    # The response contains the presigned URL
-    return response
-
-#function to get object size in S3
-def get_object_size(bucket_name, object_name, expiration=3600):
-    s3_client = boto3.client('s3')
-    try:
-        response = s3_client.head_object(Bucket=bucket_name, Key=object_name)
-
-    except ClientError as e:
-        logging.error(e)
-        return None
-
-    return response['ContentLength']     
-
 #function to read a properties file and create environment variables
 def read_properties_file(filename):
     import os
@@ -78,12 +49,34 @@ else:
     st.session_state['user_id'] = user_id
 
 
-if 'llm_chain' not in st.session_state:
-    st.session_state['llm_app'] = bedrock_claudev2
-    st.session_state['llm_chain'] = bedrock_claudev2.build_chain()
+#The chain is stateless (history is passed per call), so a single instance per attribute filter is shared by every session of the process
+@st.cache_resource(max_entries=32)
+def get_shared_chain(attribute_filter_json="null"):
+    attribute_filter = json.loads(attribute_filter_json)
+    #The unfiltered chain is the one prebuilt by the warm-up of scripts.serve
+    if attribute_filter is None:
+        return warmup.get_chain()
+    return bedrock_claudev2.build_chain(attribute_filter=attribute_filter)
+
+def get_filtered_chain():
+    attribute_filter = document_metadata.attribute_filter(
+        category=st.session_state.get('filter_category'),
+        days=st.session_state.get('filter_days')
+    )
+    return get_shared_chain(json.dumps(attribute_filter, sort_keys=True))
+
+@st.cache_resource
+def start_metrics_server():
+    return instrumentation.start_metrics_server()
+
+start_metrics_server()
+
+@st.cache_resource
+def get_session_registry():
+    return SessionRegistry()
 
 if 'chat_history' not in st.session_state:
-    st.session_state['chat_history'] = []
+    st.session_state['chat_history'] = ChatHistory()
     
 if "chats" not in st.session_state:
     st.session_state.chats = [
@@ -145,7 +138,7 @@ if clear:
     st.session_state.questions = []
     st.session_state.answers = []
     st.session_state.input = ""
-    st.session_state["chat_history"] = []
+    st.session_state["chat_history"].clear()
 
 def handle_input():
     input = st.session_state.input
@@ -154,29 +147,54 @@ def handle_input():
         'id': len(st.session_state.questions)
     }
     st.session_state.questions.append(question_with_id)
+    st.session_state.input = ""
 
+def stream_answer(q):
     chat_history = st.session_state["chat_history"]
-    if len(chat_history) == MAX_HISTORY_LENGTH:
-        chat_history = chat_history[:-1]
-
-    llm_chain = st.session_state['llm_chain']
-    chain = st.session_state['llm_app']
-    result = chain.run_chain(llm_chain, input, chat_history)
-    answer = result['answer']
-    chat_history.append((input, answer))
-    
-    document_list = []
-    if 'source_documents' in result:
-        for d in result['source_documents']:
-            if not (d.metadata['source'] in document_list):
-                document_list.append((d.metadata['source']))
+
+    llm_chain = get_filtered_chain()
+    chain = bedrock_claudev2
+
+    #The streamed answer is drawn in a placeholder and replaced by the regular chat message once complete
+    placeholder = st.empty()
+    with placeholder.container():
+        col1, col2 = st.columns([1,12])
+        with col1:
+            st.image(AI_ICON, use_column_width='always')
+        with col2:
+            answer_box = st.empty()
+            answer_box.info("...")
+            answer = ""
+            #'auto' leaves the choice to the router (and GENAI_MODEL_ROUTER), as in api_server.parse_request
+            model = st.session_state.get('model', 'auto')
+            if model == 'auto':
+                model = None
+            try:
+                for result in chain.run_chain_stream(llm_chain, q['question'], chat_history.as_tuples(), model=model):
+                    if 'token' in result:
+                        answer += result['token']
+                        answer_box.info(answer + "▌")
+                error = None
+            except Exception as e:
+                logging.exception("Answer failed")
+                error = e
+    placeholder.empty()
+    if error is not None:
+        #The question is dropped so the next rerun does not ask it again, and the input box is still drawn
+        st.session_state.questions.remove(q)
+        st.error(f"The question could not be answered, please try again: {error}")
+        return False
+    chat_history.add(q['question'], result['answer'])
+
+    #Source metadata is captured once here instead of on every rerun
+    document_list = source_links.describe_sources(result.get('source_documents', []))
 
     st.session_state.answers.append({
         'answer': result,
         'sources': document_list,
         'id': len(st.session_state.questions)
     })
-    st.session_state.input = ""
+    return True
 
 def write_user_message(md):
     col1, col2 = st.columns([1,12])
@@ -187,16 +205,6 @@ def write_user_message(md):
         st.warning(md['question'])
 
 
-def render_result(result):
-    answer, sources = st.tabs(['Answer', 'Sources'])
-    with answer:
-        render_answer(result['answer'])
-    with sources:
-        if 'source_documents' in result:
-            render_sources(result['source_documents'])
-        else:
-            render_sources([])
-
 def render_answer(answer):
     col1, col2 = st.columns([1,12])
     with col1:
@@ -209,11 +217,11 @@ def render_sources(sources):
     with col2:
         with st.expander("Sources"):
             for s in sources:
-                s3_bucket_name = s.split('/')[3]
-                key = s.split(s3_bucket_name)[-1][1:]
-                pre_signed_url = create_presigned_url(s3_bucket_name, key)
-                file_size = get_object_size(s3_bucket_name, key)
-                st.markdown(f'[{key.replace("Documents/","")}]({pre_signed_url})  ({round(file_size/1048576,2)} MB)')
+                pre_signed_url = source_links.source_url(s)
+                if s['size'] is None:
+                    st.markdown(f'[{s["title"]}]({pre_signed_url})')
+                else:
+                    st.markdown(f'[{s["title"]}]({pre_signed_url})  ({round(s["size"]/1048576,2)} MB)')
 
     
 #Each answer will have context of the question asked in order to associate the provided feedback with the respective question
@@ -222,12 +230,51 @@ def write_chat_message(md, q):
     with chat:
         render_answer(md['answer'])
         render_sources(md['sources'])
+        if st.session_state.get('show_traces') and 'trace' in md['answer']:
+            col1, col2 = st.columns([1,12])
+            with col2:
+                write_trace(md['answer']['trace'])
     
         
 with st.container():
   for (q, a) in zip(st.session_state.questions, st.session_state.answers):
     write_user_message(q)
     write_chat_message(a, q)
+  #Questions without an answer yet are streamed token by token into the page
+  for q in st.session_state.questions[len(st.session_state.answers):]:
+    write_user_message(q)
+    if stream_answer(q):
+        write_chat_message(st.session_state.answers[-1], q)
 
 st.markdown('---')
 input = st.text_input("You are talking to an AI, ask any question.", key="input", on_change=handle_input)
+
+def model_label(route):
+    if route == 'auto':
+        return 'Automatic (by question)'
+    config = router.ROUTES[route]
+    return f"{PROVIDER_MAP[config['provider']]} {config['label']}"
+
+st.sidebar.selectbox("Model", ['auto'] + list(router.ROUTES), format_func=model_label, key="model")
+#Narrows every Kendra Retrieve call to the documents matching these attributes
+st.sidebar.selectbox("Search in category", [None] + document_metadata.CATEGORIES,
+                     format_func=lambda c: 'All documents' if c is None else c, key="filter_category")
+st.sidebar.selectbox("Uploaded within", [None, 1, 7, 30, 90],
+                     format_func=lambda d: 'Any time' if d is None else f"Last {d} day(s)", key="filter_days")
+st.sidebar.checkbox("Show request traces", key="show_traces")
+
+session_registry = get_session_registry()
+session_bytes = session_registry.update(user_id, st.session_state)
+with st.sidebar.expander("Memory metrics"):
+    metrics = session_registry.snapshot()
+    st.caption(f"This session: {round(session_bytes/1024, 1)} KB")
+    st.caption(f"Active sessions: {metrics['active_sessions']}")
+    st.caption(f"Average per session: {round(metrics['session_state_bytes_avg']/1024, 1)} KB")
+    st.caption(f"Process max RSS: {round(metrics['process_max_rss_bytes']/1048576, 1)} MB")
+
+with st.sidebar.expander("Model routes"):
+    for route, values in router.stats.snapshot().items():
+        st.caption(f"{model_label(route)}: {values['requests']} answers, {values['avg_seconds']} s average, {values['cost_usd']} USD")
+    rewrites = condense.stats.snapshot()
+    st.caption(f"Question rewrites: {rewrites['rewrites']} run, {rewrites['skipped']} skipped "
+               f"(~{rewrites['saved_seconds']} s saved)")
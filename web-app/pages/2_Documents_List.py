@@ -1,46 +1,25 @@
 import streamlit as st
-import boto3
-import logging
-from botocore.exceptions import ClientError
-import time
+import math
 
-region_name = boto3.Session().region_name
+from scripts import clients
+from scripts import config
+from scripts.catalog import DocumentCatalog
+from scripts.instrumentation import RequestTrace
+from scripts.trace_panel import write_trace
 
+PAGE_SIZES = [25, 50, 100]
+SORT_OPTIONS = {
+    "Name": "name",
+    "Size": "size",
+    "Last modified": "last_modified"
+}
 
-def create_presigned_url(bucket_name, object_name, expiration=3600):
-    """Generate a presigned URL to share an S3 object
 
-    :param bucket_name: string
-    :param object_name: string
-    :param expiration: Time in seconds for the presigned URL to remain valid
-    :return: Presigned URL as string. If error, returns None.
-    """
-
-    # Generate a presigned URL for the S3 object
-    s3_client = boto3.client('s3')
-    try:
-        response = s3_client.generate_presigned_url('get_object',
-                                                    Params={'Bucket': bucket_name,
-                                                            'Key': object_name},
-                                                    ExpiresIn=expiration)
-    except ClientError as e:
-        logging.error(e)
-        return None
-
-    # The response contains the presigned URL
-    return response
-
-
-
-def get_parameter(name):
-    """
-    This function retrieves a specific value from Systems Manager"s ParameterStore.
-    """     
-    ssm_client = boto3.client("ssm",region_name=region_name)
-    response = ssm_client.get_parameter(Name=name)
-    value = response["Parameter"]["Value"]
-    
-    return value
+#The catalog is shared by every session, it keeps the listing and the presigned URLs in memory
+@st.cache_resource
+def get_catalog():
+    s3_bucket_name = config.get_parameter("genai_s3_bucket")
+    return DocumentCatalog(clients.get_client("s3"), s3_bucket_name)
 
 
 st.set_page_config(
@@ -57,27 +36,41 @@ with c2:
 
 st.info("If you recently uploaded new documents, please wait for a few minutes the Kendra to index them.")
 
+c1, c2, c3 = st.columns([4, 2, 2])
+with c1:
+    query = st.text_input("Search", placeholder="File name")
+with c2:
+    sort_by = st.selectbox("Sort by", list(SORT_OPTIONS.keys()))
+with c3:
+    page_size = st.selectbox("Per page", PAGE_SIZES, index=1)
+descending = st.toggle("Descending order")
+
+if st.button("Refresh list"):
+    get_catalog().refresh(force=True)
+
 with st.spinner("Getting file list from knowledge base, please wait..."):
     
-    start_time = time.time()
-    
-    s3_bucket_name = get_parameter("genai_s3_bucket")
-    
-    s3_client = boto3.client('s3')
-    
-    response = s3_client.list_objects_v2(Bucket=s3_bucket_name, Prefix="Documents")
-    
-    files = response.get("Contents")
+    trace = RequestTrace("documents_list")
+
+    catalog = get_catalog()
+    page = st.session_state.setdefault("documents_page", 1)
+    with trace.stage("list"):
+        files, total = catalog.page(query, SORT_OPTIONS[sort_by], descending, page, page_size)
+        pages = max(1, math.ceil(total / page_size))
+        if page > pages:
+            page = pages
+            st.session_state["documents_page"] = page
+            files, total = catalog.page(query, SORT_OPTIONS[sort_by], descending, page, page_size)
+    trace.set("documents", total)
     
-    if len(files)>1:
+    if total > 0:
     
         for file in files:
-            if file['Size'] > 0:
-                url = create_presigned_url(s3_bucket_name, file["Key"])
-                st.markdown(f'[{file["Key"].replace("Documents/","")}]({url})  ({round(file["Size"]/1048576,2)} MB)')
+            st.markdown(f'[{file["name"]}]({file["url"]})  ({round(file["size"]/1048576,2)} MB)')
+
+        st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, key="documents_page")
         
-        execution_time = round(time.time() - start_time, 2)
-        st.success(str(len(files)-1)+" files found.")
-        st.caption(f"Execution time: {execution_time} seconds")                      
+        st.success(str(total)+" files found.")
+        write_trace(trace.finish())
     else:
-        st.warning("No files found in knowledge base.")
\ No newline at end of file
+        st.warning("No files found in knowledge base.")
@@ -1,21 +1,80 @@
 import streamlit as st
-import boto3
-import os
 import time
 
-region_name = boto3.Session().region_name
+from scripts import clients
+from scripts import config
+from scripts import direct_ingest
+from scripts import document_metadata
+from scripts.ingest_manifest import IngestManifest, content_hash
+from scripts import retrieval_cache
+from scripts.instrumentation import RequestTrace
+from scripts.trace_panel import write_trace
+from scripts.sync_scheduler import SyncScheduler
+from scripts.uploads import UploadBatch
 
-document_dir = "./data"
+def invalidate_caches():
+    #Documents pushed with BatchPutDocument are searchable right away. Synced documents
+    #clear the caches of every task once their job completed (see retrieval_cache.watch_sync_jobs)
+    retrieval_cache.get_cache().invalidate()
+    retrieval_cache.invalidate_answer_cache()
 
-def get_parameter(name):
-    """
-    This function retrieves a specific value from Systems Manager"s ParameterStore.
-    """     
-    ssm_client = boto3.client("ssm",region_name=region_name)
-    response = ssm_client.get_parameter(Name=name)
-    value = response["Parameter"]["Value"]
-    
-    return value
+@st.cache_resource
+def get_ingest_manifest():
+    return IngestManifest(clients.get_client("s3"), config.get_parameters()["genai_s3_bucket"])
+
+def assign_manifest_sync_job(job_id):
+    #The sync job picks up every document uploaded until now, they are marked indexed once it succeeded
+    manifest = get_ingest_manifest().load()
+    manifest.assign_job(job_id)
+    manifest.save()
+
+def get_sync_watcher():
+    parameters = config.get_parameters()
+    return retrieval_cache.watch_sync_jobs(
+        clients.get_client("kendra"),
+        parameters["genai_kendra_index_id"],
+        parameters["genai_s3_data_source_id"]
+    ).watcher
+
+def mark_succeeded_syncs_indexed(manifest):
+    #A failed or stopped job leaves its documents pending, so they are synced again
+    watcher = get_sync_watcher()
+    watcher.maybe_check()
+    if manifest.mark_jobs_indexed(watcher.succeeded_job_ids):
+        manifest.save()
+
+#One scheduler per process coalesces the sync requests of every session
+@st.cache_resource
+def get_sync_scheduler():
+    parameters = config.get_parameters()
+    return SyncScheduler(
+        clients.get_client("kendra"),
+        parameters["genai_kendra_index_id"],
+        parameters["genai_s3_data_source_id"],
+        on_sync_started=[assign_manifest_sync_job]
+    )
+
+def write_sync_status():
+    status = get_sync_scheduler().status()
+    with st.expander("Knowledge base sync status"):
+        if status["pending_requests"]:
+            st.caption(f"Sync queued for {status['pending_requests']} upload(s)")
+        if "job_status" in status:
+            st.caption(f"Last sync job: {status['job_status']} (started {status['job_started']})")
+            metrics = status["job_metrics"]
+            if metrics:
+                st.caption(f"Added: {metrics.get('DocumentsAdded')}, modified: {metrics.get('DocumentsModified')}, "
+                           f"deleted: {metrics.get('DocumentsDeleted')}, failed: {metrics.get('DocumentsFailed')}")
+        st.caption(f"Indexed documents: {status['indexed_documents']}")
+        manifest = get_ingest_manifest()
+        mark_succeeded_syncs_indexed(manifest)
+        stats = manifest.stats
+        if stats:
+            st.caption(f"Unchanged uploads skipped: {stats.get('uploads_avoided', 0)} "
+                       f"({round(stats.get('bytes_avoided', 0)/1048576, 1)} MB), "
+                       f"sync jobs avoided: {stats.get('sync_jobs_avoided', 0)}")
+        if status["last_error"]:
+            st.warning(status["last_error"])
 
 st.set_page_config(
     page_title="Amazon Bedrock Demos"
@@ -44,41 +103,116 @@ uploaded_files = st.file_uploader(
                                     accept_multiple_files=True
                                 )
 
+#Written to the Metadata/ sidecar of every file, so the chat can be restricted to a category or recent uploads
+c1, c2 = st.columns(2)
+with c1:
+    category = st.selectbox("Category", document_metadata.CATEGORIES)
+with c2:
+    owner = st.text_input("Owner", placeholder="Team or person responsible for the documents")
+
 if st.button("Upload Files", key=uploaded_files):
 
     if len(uploaded_files) == 0:
         st.error("Please select local files to upload")
         
     else:
-        with st.spinner("Uploading your files to knowledge base, please wait..."):
-            
-            start_time = time.time()
-            
-            s3 = boto3.client('s3')
-            s3_documents_folder = 'Documents'
-            s3_bucket_name = get_parameter("genai_s3_bucket")
-            genai_kendra_index_id = get_parameter("genai_kendra_index_id")
-            genai_s3_data_source_id = get_parameter("genai_s3_data_source_id")
-            
-            if not os.path.exists(document_dir):
-                os.makedirs(document_dir)
-                
-            for uploaded_file in uploaded_files:
-                file_name = uploaded_file.name
-                with open(os.path.join("data",file_name),"wb") as f:
-                    f.write(uploaded_file.getbuffer())        
-            
-                local_file = document_dir+"/"+file_name
-                s3.upload_file(local_file, s3_bucket_name, s3_documents_folder+"/"+file_name)
-                os.remove(local_file)            
-
-            kendra = boto3.client("kendra")
-            
-            sync_response = kendra.start_data_source_sync_job(
-                Id = genai_s3_data_source_id,
-                IndexId = genai_kendra_index_id
-            )
-                
-            execution_time = round(time.time() - start_time, 2)
-            st.success("The above valid files were uploaded to S3. Please give it some time for Kendra to index them.")
-            st.caption(f"Execution time: {execution_time} seconds")
\ No newline at end of file
+        trace = RequestTrace("add_documents")
+
+        s3_documents_folder = 'Documents'
+        parameters = config.get_parameters()
+        s3_bucket_name = parameters["genai_s3_bucket"]
+
+        #Files whose content hash is already in the manifest are neither uploaded nor synced again
+        manifest = get_ingest_manifest().load()
+        mark_succeeded_syncs_indexed(manifest)
+        digests, changed_files, skipped = {}, [], []
+        with trace.stage("hash"):
+            for f in uploaded_files:
+                digests[f.name] = content_hash(f.getbuffer())
+                if manifest.is_unchanged(s3_documents_folder + "/" + f.name, digests[f.name], f.size):
+                    manifest.record_skip(f.size)
+                    skipped.append(f.name)
+                else:
+                    changed_files.append(f)
+        trace.set("unchanged", len(skipped))
+        trace.set("bytes_avoided", sum(f.size for f in uploaded_files if f.name in skipped))
+        if skipped:
+            st.info(f"{len(skipped)} file(s) are already in the knowledge base and were not uploaded again: {', '.join(skipped)}")
+
+        #Files are streamed from memory to S3 in parallel, with one progress bar per file
+        batch = UploadBatch(clients.get_client("s3"), s3_bucket_name, changed_files, prefix=s3_documents_folder).start()
+        progress_bars = {f.name: st.progress(0.0, text=f.name) for f in changed_files}
+        while True:
+            finished = batch.done()
+            for file_name, state in batch.progress().items():
+                fraction = min(state["sent"] / state["size"], 1.0) if state["size"] else 1.0
+                progress_bars[file_name].progress(fraction, text=f"{file_name} ({state['status']})")
+            if finished:
+                break
+            time.sleep(0.2)
+
+        results = batch.wait()
+        failed = {name: state for name, state in results.items() if state["status"] == "failed"}
+        trace.add("upload", seconds=time.time() - trace.started, files=len(results), failed=len(failed),
+                  bytes=sum(state["sent"] for state in results.values()))
+        for file_name, state in failed.items():
+            st.error(f"{file_name} could not be uploaded: {state['error']}")
+        for f in changed_files:
+            if f.name not in failed:
+                manifest.record_upload(s3_documents_folder + "/" + f.name, digests[f.name], f.size)
+
+        if len(failed) < len(results):
+            #Small files are pushed straight into the index, the others wait for the S3 sync
+            uploaded = [f for f in changed_files if f.name not in failed]
+            attributes = {
+                f.name: document_metadata.document_attributes(f.name, f.size, category=category, owner=owner.strip() or None)
+                for f in uploaded
+            }
+            with trace.stage("direct_ingest"), st.spinner("Adding the files to the index..."):
+                ingested, fallback, sidecar_errors = direct_ingest.ingest(
+                    clients.get_client("kendra"),
+                    clients.get_client("s3"),
+                    parameters["genai_kendra_index_id"],
+                    s3_bucket_name,
+                    clients.region_name,
+                    uploaded,
+                    prefix=s3_documents_folder,
+                    attributes=attributes
+                )
+            #Files left to the S3 sync get their attributes from the sidecar
+            for file_name in fallback:
+                key = s3_documents_folder + "/" + file_name
+                try:
+                    document_metadata.write_sidecar(
+                        clients.get_client("s3"),
+                        s3_bucket_name,
+                        key,
+                        direct_ingest.document_id(s3_bucket_name, key),
+                        file_name,
+                        direct_ingest.content_type(file_name),
+                        {**attributes[file_name], "_source_uri": direct_ingest.source_uri(clients.region_name, s3_bucket_name, key)}
+                    )
+                except Exception as e:
+                    sidecar_errors[file_name] = e
+            for file_name, error in sidecar_errors.items():
+                st.error(f"The category and owner of {file_name} could not be saved, it is indexed without them: {error}")
+            trace.set("sidecar_errors", len(sidecar_errors))
+            trace.set("ingested", len(ingested))
+            trace.set("left_to_sync", len(fallback))
+            if ingested:
+                manifest.mark_indexed([s3_documents_folder + "/" + name for name in ingested])
+                invalidate_caches()
+                st.success(f"{len(ingested)} file(s) are already searchable: {', '.join(ingested)}")
+            if fallback:
+                st.success(f"{len(fallback)} file(s) were uploaded to S3. Please give it some time for Kendra to index them.")
+
+        #A sync is only requested for documents the index has not seen yet and no running job picks up
+        if manifest.needs_sync(get_sync_watcher().failed_job_ids):
+            get_sync_scheduler().request()
+        elif skipped:
+            manifest.count("sync_jobs_avoided")
+        manifest.save()
+
+        write_trace(trace.finish())
+
+write_sync_status()
@@ -0,0 +1,207 @@
+import os
+import re
+import json
+import math
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.environ.get("GENAI_ANSWER_CACHE", "memory")    # memory | redis | off
+CACHE_TTL = int(os.environ.get("GENAI_ANSWER_CACHE_TTL", "3600"))
+CACHE_SIZE = int(os.environ.get("GENAI_ANSWER_CACHE_SIZE", "1000"))
+REDIS_URL = os.environ.get("GENAI_REDIS_URL", "redis://localhost:6379/0")
+#Cosine similarity above which a cached answer is reused for a differently worded question. Empty disables it.
+SIMILARITY_THRESHOLD = os.environ.get("GENAI_ANSWER_CACHE_SIMILARITY", "")
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v1"
+
+
+def normalize_question(question):
+    """
+    Lower case, strip punctuation and collapse whitespace so trivially different
+    spellings of the same standalone question share a cache entry.
+    """
+    text = re.sub(r"[^\w\s]", " ", question.lower())
+    return " ".join(text.split())
+
+
+def cosine_similarity(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    if norm == 0:
+        return 0.0
+    return dot / norm
+
+
+class MemoryBackend:
+    """
+    In-process LRU cache with a TTL per entry, for a single task.
+    """
+
+    def __init__(self, max_size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def version(self):
+        return self._version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._version += 1
+
+
+class RedisBackend:
+    """
+    Cache shared by every task of the Fargate service. Works with any client
+    exposing the redis-py get/set/incr API, such as fakeredis for local runs.
+    Eviction relies on the key TTL and on the server's maxmemory-policy (allkeys-lru).
+    Invalidation bumps a version counter that is part of every key.
+    """
+
+    VERSION_KEY = "genai:answers:version"
+
+    def __init__(self, client=None, ttl=CACHE_TTL):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(REDIS_URL)
+        self.client = client
+        self.ttl = ttl
+
+    def version(self):
+        return int(self.client.get(self.VERSION_KEY) or 0)
+
+    def get(self, key):
+        value = self.client.get(key)
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def set(self, key, value):
+        self.client.set(key, json.dumps(value), ex=self.ttl)
+
+    def invalidate(self):
+        self.client.incr(self.VERSION_KEY)
+
+
+class AnswerCache:
+    """
+    Answer cache keyed on the normalized standalone question, the route pinned
+    by the request (None when routed automatically) and the index version.
+
+    Exact matches are looked up in the backend. When an embedding function and a
+    similarity threshold are given, questions seen by this process are also kept
+    with their embedding, and the closest one above the threshold is used as key.
+    Cached values must be JSON serializable.
+    """
+
+    def __init__(self, backend, embed=None, similarity_threshold=None, max_embeddings=CACHE_SIZE):
+        self.backend = backend
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.max_embeddings = max_embeddings
+        self._embeddings = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, version, normalized, route=None):
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        return f"genai:answers:v{version}:{route or 'auto'}:{digest}"
+
+    def _similar_question(self, normalized):
+        if not self.embed or not self.similarity_threshold:
+            return None
+        vector = self.embed(normalized)
+        best, best_score = None, self.similarity_threshold
+        with self._lock:
+            candidates = list(self._embeddings.items())
+        for question, other in candidates:
+            score = cosine_similarity(vector, other)
+            if score >= best_score:
+                best, best_score = question, score
+        return best
+
+    def get(self, question, route=None):
+        normalized = normalize_question(question)
+        version = self.backend.version()
+        value = self.backend.get(self._key(version, normalized, route))
+        if value is None:
+            similar = self._similar_question(normalized)
+            if similar is not None:
+                value = self.backend.get(self._key(version, similar, route))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            logger.info("answer cache hit for %r", normalized)
+        return value
+
+    def set(self, question, value, route=None):
+        normalized = normalize_question(question)
+        self.backend.set(self._key(self.backend.version(), normalized, route), value)
+        if self.embed and self.similarity_threshold:
+            vector = self.embed(normalized)
+            with self._lock:
+                self._embeddings[normalized] = vector
+                self._embeddings.move_to_end(normalized)
+                while len(self._embeddings) > self.max_embeddings:
+                    self._embeddings.popitem(last=False)
+
+    def invalidate(self):
+        """
+        Drops every cached answer, called when the Kendra index content changes.
+        """
+        self.backend.invalidate()
+        with self._lock:
+            self._embeddings.clear()
+        logger.info("answer cache invalidated")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Returns the process-wide answer cache configured from the environment,
+    or None when GENAI_ANSWER_CACHE=off.
+    """
+    global _cache
+    if CACHE_BACKEND == "off":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            backend = RedisBackend() if CACHE_BACKEND == "redis" else MemoryBackend()
+            embed, threshold = None, None
+            if SIMILARITY_THRESHOLD:
+                from langchain.embeddings import BedrockEmbeddings
+                embed = BedrockEmbeddings(model_id=EMBEDDING_MODEL_ID).embed_query
+                threshold = float(SIMILARITY_THRESHOLD)
+            _cache = AnswerCache(backend, embed=embed, similarity_threshold=threshold)
+        return _cache
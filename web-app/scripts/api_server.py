@@ -0,0 +1,340 @@
+"""
+Headless API of the RAG chain, served by any ASGI server. Run from the web-app folder:
+
+    uvicorn scripts.api_server:app --host 0.0.0.0 --port 8080
+
+POST /ask            {"question": str, "user_id": str, "model": "auto"|"fast"|"quality", "stream": bool,
+                      "category": str, "days": int}
+                     JSON answer, or Server-Sent Events "token" and "answer" when stream is true
+WS   /ws             same requests as JSON messages, answered with {"token"} messages then the answer
+DELETE /sessions/ID  clears the chat history of a user
+GET  /health         200 once the warm-up is done (see scripts.warmup)
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+
+import scripts.kendra_chat_bedrock_claudev2 as bedrock_claudev2
+from scripts import document_metadata
+from scripts import router
+from scripts import sources as source_links
+from scripts.history import ChatHistory
+from scripts.instrumentation import RequestTrace
+from scripts import warmup
+
+logger = logging.getLogger(__name__)
+
+#Questions answered at the same time by one process, the others wait up to QUEUE_TIMEOUT seconds
+MAX_CONCURRENCY = int(os.environ.get("GENAI_API_MAX_CONCURRENCY", "32"))
+QUEUE_TIMEOUT = float(os.environ.get("GENAI_API_QUEUE_TIMEOUT", "10"))
+#Chat histories kept in memory, the least recently used ones are dropped first
+MAX_SESSIONS = int(os.environ.get("GENAI_API_MAX_SESSIONS", "10000"))
+SESSION_TTL = int(os.environ.get("GENAI_API_SESSION_TTL", "3600"))
+#Chains built for a category or date filter, the least recently used ones are dropped first
+MAX_FILTERED_CHAINS = int(os.environ.get("GENAI_API_MAX_FILTERED_CHAINS", "32"))
+PORT = int(os.environ.get("GENAI_API_PORT", "8080"))
+
+_DONE = object()
+
+
+class Session:
+
+    def __init__(self):
+        self.history = ChatHistory()
+        self.lock = asyncio.Lock()
+        self.used = time.time()
+
+
+class SessionStore:
+    """
+    Chat history per user_id, bounded in number and idle time. Requests of
+    one user are answered in order through the session lock.
+    """
+
+    def __init__(self, max_sessions=MAX_SESSIONS, ttl=SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+
+    def get(self, user_id):
+        now = time.time()
+        session = self._sessions.pop(user_id, None)
+        if session is None or now - session.used > self.ttl:
+            session = Session()
+        session.used = now
+        self._sessions[user_id] = session
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return session
+
+    def clear(self, user_id):
+        return self._sessions.pop(user_id, None) is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class BusyError(Exception):
+    """
+    Raised when no answer slot became free within QUEUE_TIMEOUT.
+    """
+
+
+class ChainService:
+    """
+    The shared chain with the worker threads running it and the concurrency limit.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, queue_timeout=QUEUE_TIMEOUT, max_filtered_chains=MAX_FILTERED_CHAINS):
+        self.chain = None
+        #Chains built with an attribute filter, keyed by its JSON. The date filter changes
+        #every day, so the least recently used ones are dropped
+        self.filtered_chains = OrderedDict()
+        self.max_filtered_chains = max_filtered_chains
+        self.sessions = SessionStore()
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="rag")
+        self._slots = None
+        self.active = 0
+
+    async def start(self):
+        #Created on the server's event loop
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        #Same shared chain as the Streamlit page, /health stays 503 until the warm-up opened the connections
+        self.chain = await asyncio.get_running_loop().run_in_executor(self.executor, warmup.prepare)
+
+    def stop(self):
+        self.executor.shutdown(wait=False)
+
+    async def acquire(self):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise BusyError()
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._slots.release()
+
+    async def get_chain(self, attribute_filter=None):
+        if attribute_filter is None:
+            return self.chain
+        key = json.dumps(attribute_filter, sort_keys=True)
+        chain = self.filtered_chains.pop(key, None)
+        if chain is None:
+            chain = await asyncio.get_running_loop().run_in_executor(
+                self.executor, bedrock_claudev2.build_chain, attribute_filter)
+        self.filtered_chains[key] = chain
+        while len(self.filtered_chains) > self.max_filtered_chains:
+            self.filtered_chains.popitem(last=False)
+        return chain
+
+    async def stream(self, question, history, model=None, attribute_filter=None):
+        """
+        Runs run_chain_stream in a worker thread and yields its items. The
+        generator is closed when the consumer goes away (client disconnect).
+        """
+        chain = await self.get_chain(attribute_filter)
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def produce():
+            items = bedrock_claudev2.run_chain_stream(chain, question, history, RequestTrace("api"), model)
+            try:
+                for item in items:
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                items.close()
+                loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+        loop.run_in_executor(self.executor, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            cancelled.set()
+
+    async def ask(self, session, question, model=None, attribute_filter=None):
+        """
+        Yields the tokens then the final result of a question, and records the
+        turn in the session history. The session lock keeps the turns in order.
+        """
+        async with session.lock:
+            result = None
+            async for item in self.stream(question, session.history.as_tuples(), model, attribute_filter):
+                if "token" in item:
+                    yield item
+                else:
+                    result = item
+            session.history.add(question, result["answer"])
+            yield result
+
+
+def to_response(result):
+    """
+    JSON-ready answer with the distinct sources and their presigned URLs. Can call S3, so it runs in a thread.
+    """
+    sources = source_links.describe_sources(result.get("source_documents", []))
+    return {
+        "answer": result["answer"],
+        "sources": [{**s, "url": source_links.source_url(s)} for s in sources],
+        "degraded": result.get("degraded", False),
+        "trace": result.get("trace")
+    }
+
+
+def parse_request(body):
+    if not isinstance(body, dict):
+        raise ValueError("the request must be a JSON object")
+    question = body.get("question") or ""
+    if not isinstance(question, str) or not question.strip():
+        raise ValueError("question is required")
+    user_id = body.get("user_id") or str(uuid.uuid4())
+    if not isinstance(user_id, str):
+        raise ValueError("user_id must be a string")
+    model = body.get("model") or "auto"
+    if model != "auto" and model not in router.ROUTES:
+        raise ValueError(f"model must be one of auto, {', '.join(router.ROUTES)}")
+    if model == "auto":
+        model = None
+    category = body.get("category")
+    if category is not None and not isinstance(category, str):
+        raise ValueError("category must be a string")
+    try:
+        days = int(body["days"]) if body.get("days") else None
+    except (TypeError, ValueError):
+        raise ValueError("days must be a number")
+    attribute_filter = document_metadata.attribute_filter(category=category, days=days)
+    return question.strip(), user_id, {"model": model, "attribute_filter": attribute_filter}
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+service = ChainService()
+
+
+async def ask(request):
+    try:
+        body = await request.json()
+        question, user_id, options = parse_request(body)
+    except (ValueError, json.JSONDecodeError) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    session = service.sessions.get(user_id)
+    try:
+        await service.acquire()
+    except BusyError:
+        return JSONResponse({"error": "too many requests in progress"}, status_code=503, headers={"Retry-After": "1"})
+
+    if not body.get("stream"):
+        try:
+            async for item in service.ask(session, question, **options):
+                result = item
+        finally:
+            service.release()
+        response = await asyncio.to_thread(to_response, result)
+        return Response(json.dumps({"user_id": user_id, **response}, default=str), media_type="application/json")
+
+    async def events():
+        try:
+            async for item in service.ask(session, question, **options):
+                if "token" in item:
+                    yield sse("token", item)
+                else:
+                    response = await asyncio.to_thread(to_response, item)
+                    yield sse("answer", {"user_id": user_id, **response})
+        except Exception as e:
+            logger.exception("Streaming answer failed")
+            yield sse("error", {"error": str(e)})
+        finally:
+            service.release()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+async def websocket_ask(websocket):
+    await websocket.accept()
+    try:
+        while True:
+            message = await websocket.receive_text()
+            try:
+                question, user_id, options = parse_request(json.loads(message))
+            except ValueError as e:
+                await websocket.send_json({"error": str(e)})
+                continue
+            try:
+                await service.acquire()
+            except BusyError:
+                await websocket.send_json({"error": "too many requests in progress", "retry_after": 1})
+                continue
+            try:
+                async for item in service.ask(service.sessions.get(user_id), question, **options):
+                    if "token" in item:
+                        await websocket.send_json(item)
+                    else:
+                        response = await asyncio.to_thread(to_response, item)
+                        await websocket.send_text(json.dumps({"user_id": user_id, **response}, default=str))
+            finally:
+                service.release()
+    except WebSocketDisconnect:
+        pass
+
+
+async def clear_session(request):
+    cleared = service.sessions.clear(request.path_params["user_id"])
+    return JSONResponse({"cleared": cleared})
+
+
+async def health(request):
+    if service.chain is None:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    return JSONResponse({"status": "ok", "active": service.active, "sessions": len(service.sessions)})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await service.start()
+    yield
+    service.stop()
+
+
+app = Starlette(
+    routes=[
+        Route("/ask", ask, methods=["POST"]),
+        WebSocketRoute("/ws", websocket_ask),
+        Route("/sessions/{user_id}", clear_session, methods=["DELETE"]),
+        Route("/health", health)
+    ],
+    lifespan=lifespan
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=PORT)
@@ -0,0 +1,112 @@
+import re
+import time
+import asyncio
+import logging
+
+import scripts.kendra_chat_bedrock_claudev2 as bedrock_claudev2
+from scripts import condense
+from scripts import resilience
+from scripts.retrieval_cache import LatencyTracker, kendra_latency
+from scripts.instrumentation import RequestTrace
+from scripts.trace_callbacks import TraceCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+#Hedge delay used until enough Kendra latencies have been observed
+DEFAULT_HEDGE_SECONDS = 1.0
+MIN_SAMPLES = 20
+#Words that do not change what Kendra returns, ignored when comparing the raw and rewritten questions
+STOP_WORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "do", "does", "did", "what", "how", "why",
+    "when", "where", "which", "who", "can", "i", "you", "of", "in", "on", "for", "to", "and", "or", "with"
+}
+
+pipeline_latency = LatencyTracker()
+stats = {"speculative_hits": 0, "speculative_misses": 0, "hedged_requests": 0, "hedge_wins": 0}
+
+
+def content_terms(text):
+    return {w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOP_WORDS}
+
+
+def hedge_delay():
+    if kendra_latency.count() < MIN_SAMPLES:
+        return DEFAULT_HEDGE_SECONDS
+    return kendra_latency.percentile(95)
+
+
+async def retrieve(chain, question):
+    #Kendra latencies are recorded by the CachingRetriever, on cache misses only
+    return await asyncio.to_thread(chain.retriever.invoke, question)
+
+
+async def hedged_retrieve(chain, question, delay=None):
+    """
+    Runs a Kendra Retrieve and, if it has not answered after the p95 latency,
+    sends a duplicate request. The first result to arrive is used.
+    """
+    delay = hedge_delay() if delay is None else delay
+    first = asyncio.ensure_future(retrieve(chain, question))
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+
+    stats["hedged_requests"] += 1
+    second = asyncio.ensure_future(retrieve(chain, question))
+    done, pending = await asyncio.wait({first, second}, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        #The boto3 call keeps running in its thread, its result is ignored
+        task.cancel()
+    winner = done.pop()
+    if winner is second:
+        stats["hedge_wins"] += 1
+    return winner.result()
+
+
+async def run_chain_async(chain, prompt: str, history=[], trace=None, model=None):
+    """
+    asyncio variant of run_chain, with the same result shape (trace and
+    degraded flag included). When the question needs rewriting, Kendra is
+    queried for the raw question while the rewrite is in flight. The
+    speculative results are kept when the standalone question adds no new
+    terms to the raw one, otherwise Kendra is queried again with the
+    standalone question. Blocking steps run in worker threads and the Kendra
+    calls are hedged.
+    """
+    start_time = time.time()
+    trace = trace or RequestTrace()
+    callbacks = [TraceCallbackHandler(trace)]
+
+    speculative = None
+    if condense.needs_rewrite(prompt, history):
+        speculative = asyncio.ensure_future(hedged_retrieve(chain, prompt))
+    try:
+        question = await asyncio.to_thread(bedrock_claudev2.condense_question, chain, prompt, history, callbacks, trace)
+        result = bedrock_claudev2.cached_result(question, chain, model)
+        trace.set("cache_hit", result is not None)
+        if result is None:
+            docs = None
+            try:
+                keep_speculative = speculative is not None and content_terms(question) <= content_terms(prompt)
+                if speculative is not None:
+                    stats["speculative_hits" if keep_speculative else "speculative_misses"] += 1
+                with trace.stage("retrieve"):
+                    docs = await (speculative if keep_speculative else hedged_retrieve(chain, question))
+                trace.add("retrieve", calls=1, results=len(docs))
+                trace.set("speculative_retrieve", keep_speculative)
+                answer = await asyncio.to_thread(bedrock_claudev2.generate, chain, question, docs, model, callbacks, trace)
+                result = {"question": question, "answer": answer, "source_documents": docs}
+                bedrock_claudev2.cache_result(question, result, chain, model)
+            except Exception as e:
+                if not resilience.is_overload_error(e):
+                    raise
+                result = await asyncio.to_thread(bedrock_claudev2.degraded_result, chain, question, e, docs)
+    finally:
+        if speculative is not None and not speculative.done():
+            #The boto3 call keeps running in its thread, its result is ignored
+            speculative.cancel()
+
+    pipeline_latency.record(time.time() - start_time)
+    trace.set("degraded", result.get("degraded", False))
+    result["trace"] = trace.finish().as_dict()
+    return result
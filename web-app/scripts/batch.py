@@ -0,0 +1,146 @@
+import os
+import csv
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from scripts.instrumentation import RequestTrace
+
+logger = logging.getLogger(__name__)
+
+#Questions answered in parallel. Bedrock and Kendra calls are still paced by the rate limiters of scripts.resilience
+BATCH_WORKERS = int(os.environ.get("GENAI_BATCH_WORKERS", "8"))
+PROGRESS_EVERY = 100
+
+
+def read_questions(path):
+    """
+    Yields {"id", "question"} from a JSONL file or a CSV file with a question
+    column. Rows without an id (missing or empty) are numbered by their
+    position in the file.
+    """
+    with open(path, newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for i, row in enumerate(rows):
+            question = (row.get("question") or "").strip()
+            if question:
+                identifier = row.get("id")
+                if identifier is None or identifier == "":
+                    identifier = i
+                yield {"id": str(identifier), "question": question}
+
+
+def completed_ids(path):
+    """
+    IDs already answered in an output file. Failed and degraded answers are
+    not counted, so they are asked again when the run is resumed.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                #Last line of an interrupted run
+                continue
+            if "error" not in record and not record.get("degraded"):
+                done.add(record["id"])
+    return done
+
+
+def drop_partial_line(path):
+    """
+    Truncates the output file after its last complete line, so the answers
+    appended by a resumed run do not start on the line of an interrupted write.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        f.seek(0)
+        end = f.read().rfind(b"\n") + 1
+        f.truncate(end)
+    logger.warning("Dropped the partial last line of %s", path)
+
+
+def answer(chain_module, chain, item, model=None):
+    start_time = time.time()
+    try:
+        result = chain_module.run_chain(chain, item["question"], [], RequestTrace("batch"), model)
+    except Exception as e:
+        logger.error("Question %s failed: %s", item["id"], e)
+        return {**item, "error": f"{type(e).__name__}: {e}"}
+    sources = []
+    for d in result.get("source_documents", []):
+        if d.metadata.get("source") not in sources:
+            sources.append(d.metadata.get("source"))
+    attributes = result.get("trace", {}).get("attributes", {})
+    return {
+        **item,
+        "standalone_question": result.get("question", item["question"]),
+        "answer": result["answer"].strip(),
+        "sources": sources,
+        "degraded": result.get("degraded", False),
+        "route": attributes.get("route"),
+        "seconds": round(time.time() - start_time, 3)
+    }
+
+
+def run_batch(chain_module, chain, input_path, output_path, workers=BATCH_WORKERS, model=None, resume=True):
+    """
+    Answers every question of input_path with a pool of workers and appends
+    one JSON line per answer to output_path as soon as it is produced. With
+    resume, questions already answered in output_path are skipped.
+    Returns the number of answered, degraded (fallback answer), failed and
+    skipped questions.
+    """
+    done = set()
+    if resume:
+        done = completed_ids(output_path)
+        drop_partial_line(output_path)
+    counts = {"answered": 0, "degraded": 0, "failed": 0, "skipped": 0}
+    lock = threading.Lock()
+    #At most 2 questions per worker are queued, the input file is read as the run progresses
+    slots = threading.Semaphore(workers * 2)
+    start_time = time.time()
+
+    with open(output_path, "a" if resume else "w") as out:
+
+        def write(future):
+            record = future.result()
+            with lock:
+                out.write(json.dumps(record, default=str) + "\n")
+                out.flush()
+                if "error" in record:
+                    counts["failed"] += 1
+                elif record["degraded"]:
+                    counts["degraded"] += 1
+                else:
+                    counts["answered"] += 1
+                finished = counts["answered"] + counts["degraded"] + counts["failed"]
+                if finished % PROGRESS_EVERY == 0:
+                    logger.info("%s questions in %.0f seconds", finished, time.time() - start_time)
+            slots.release()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for item in read_questions(input_path):
+                if item["id"] in done:
+                    counts["skipped"] += 1
+                    continue
+                slots.acquire()
+                executor.submit(answer, chain_module, chain, item, model).add_done_callback(write)
+
+    logger.info("Batch finished in %.0f seconds: %s", time.time() - start_time, counts)
+    return counts
@@ -0,0 +1,97 @@
+import time
+import logging
+import threading
+
+from scripts.presign import PresignedUrlCache
+
+logger = logging.getLogger(__name__)
+
+#The listing is served from memory and refreshed when older than this
+CATALOG_TTL = 60
+
+SORT_KEYS = {
+    "name": lambda d: d["name"].lower(),
+    "size": lambda d: d["size"],
+    "last_modified": lambda d: d["last_modified"]
+}
+
+
+class DocumentCatalog:
+    """
+    In-memory listing of the documents stored under a prefix of the bucket.
+
+    The whole prefix is listed with the list_objects_v2 paginator, so listings are
+    not cut at 1,000 keys. Entries whose ETag and LastModified did not change keep
+    their cached state (such as presigned URLs) across refreshes. Presigned URLs
+    are only generated for the rows being displayed.
+    """
+
+    def __init__(self, s3_client, bucket_name, prefix="Documents/", ttl=CATALOG_TTL):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.ttl = ttl
+        self.urls = PresignedUrlCache(s3_client)
+        self._documents = {}
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self.last_changes = {"added": 0, "changed": 0, "removed": 0}
+
+    def refresh(self, force=False):
+        with self._lock:
+            if not force and time.time() - self._refreshed_at < self.ttl:
+                return self.last_changes
+
+            documents = {}
+            paginator = self.s3_client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=self.prefix):
+                for item in page.get("Contents", []):
+                    #Skip the folder placeholder
+                    if item["Size"] == 0 and item["Key"].endswith("/"):
+                        continue
+                    documents[item["Key"]] = {
+                        "key": item["Key"],
+                        "name": item["Key"][len(self.prefix):],
+                        "size": item["Size"],
+                        "etag": item["ETag"],
+                        "last_modified": item["LastModified"]
+                    }
+
+            added = changed = 0
+            for key, document in documents.items():
+                previous = self._documents.get(key)
+                if previous is None:
+                    added += 1
+                elif (previous["etag"], previous["last_modified"]) != (document["etag"], document["last_modified"]):
+                    changed += 1
+                    self.urls.discard(self.bucket_name, key)
+            removed = len(set(self._documents) - set(documents))
+            for key in set(self._documents) - set(documents):
+                self.urls.discard(self.bucket_name, key)
+
+            self._documents = documents
+            self._refreshed_at = time.time()
+            self.last_changes = {"added": added, "changed": changed, "removed": removed}
+            logger.info("Catalog refreshed: %s documents, %s", len(documents), self.last_changes)
+            return self.last_changes
+
+    def page(self, query="", sort_by="name", descending=False, page=1, page_size=50):
+        """
+        Filters, sorts and paginates the catalog.
+
+        :return: (documents of the requested page with their presigned "url", number of matching documents)
+        """
+        self.refresh()
+        with self._lock:
+            documents = list(self._documents.values())
+
+        query = query.strip().lower()
+        if query:
+            documents = [d for d in documents if query in d["name"].lower()]
+        documents.sort(key=SORT_KEYS[sort_by], reverse=descending)
+
+        start = (page - 1) * page_size
+        rows = [dict(d) for d in documents[start:start + page_size]]
+        for row in rows:
+            row["url"] = self.urls.get(self.bucket_name, row["key"])
+        return rows, len(documents)
@@ -0,0 +1,48 @@
+import threading
+import boto3
+from botocore.config import Config
+
+from scripts import resilience
+
+#Shared by every Streamlit session of the process. Each client keeps its own
+#urllib3 pool, sized for concurrent sessions, with TCP keep-alive enabled.
+MAX_POOL_CONNECTIONS = 50
+
+BOTO_CONFIG = Config(
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    tcp_keepalive=True,
+    connect_timeout=5,
+    read_timeout=60,
+    #Adaptive mode adds client side rate limiting to the exponential backoff with jitter
+    retries={"max_attempts": 6, "mode": "adaptive"}
+)
+
+region_name = boto3.Session().region_name
+
+_session = boto3.session.Session(region_name=region_name)
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_client(service_name):
+    """
+    Returns a process-wide boto3 client for the service. boto3 clients are
+    thread safe once created, the session used to create them is not, so
+    creation is serialized.
+    """
+    client = _clients.get(service_name)
+    if client is None:
+        with _lock:
+            client = _clients.get(service_name)
+            if client is None:
+                client = resilience.install(_session.client(service_name, config=BOTO_CONFIG), service_name)
+                _clients[service_name] = client
+    return client
+
+
+def set_client(service_name, client):
+    """
+    Replaces the shared client of a service, e.g. with a stub in benchmarks.
+    """
+    with _lock:
+        _clients[service_name] = client
@@ -0,0 +1,86 @@
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+#Pronouns and references that usually point back to an earlier turn
+FOLLOW_UP_WORDS = {
+    "it", "its", "they", "them", "their", "theirs",
+    "this", "that", "these", "those",
+    "he", "him", "his", "she", "her", "hers",
+    "there", "former", "latter", "above", "previous", "same",
+    "else", "another", "other", "one", "ones"
+}
+FOLLOW_UP_PREFIXES = ("and ", "also ", "what about", "how about", "so ", "then ", "but ")
+MIN_STANDALONE_WORDS = 4
+
+#Used until a real rewrite latency has been measured
+DEFAULT_REWRITE_SECONDS = 1.5
+
+
+def needs_rewrite(question, history):
+    """
+    Cheap heuristic deciding whether a follow up question must be rephrased
+    by the LLM before it can be sent to Kendra.
+
+    :param question: question as typed by the user
+    :param history: list of (question, answer) tuples
+    :return: False when there is no history or the question looks self-contained.
+    """
+    if not history:
+        return False
+
+    text = question.strip().lower()
+    words = re.findall(r"[a-z0-9']+", text)
+    if len(words) < MIN_STANDALONE_WORDS:
+        return True
+    if text.startswith(FOLLOW_UP_PREFIXES):
+        return True
+
+    return any(word in FOLLOW_UP_WORDS for word in words)
+
+
+class RewriteStats:
+    """
+    Thread-safe counters for the condense-question step. The latency saved by a
+    skipped rewrite is estimated with the average latency of the rewrites that ran.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rewrites = 0
+        self.skipped = 0
+        self.rewrite_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def average_rewrite_seconds(self):
+        if self.rewrites == 0:
+            return DEFAULT_REWRITE_SECONDS
+        return self.rewrite_seconds / self.rewrites
+
+    def record_rewrite(self, seconds):
+        with self._lock:
+            self.rewrites += 1
+            self.rewrite_seconds += seconds
+        logger.info("condense question: rewrite took %.3f s", seconds)
+
+    def record_skip(self):
+        with self._lock:
+            saved = self.average_rewrite_seconds()
+            self.skipped += 1
+            self.saved_seconds += saved
+        logger.info("condense question: skipped, ~%.3f s saved (%.1f s total)", saved, self.saved_seconds)
+        return saved
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "rewrites": self.rewrites,
+                "skipped": self.skipped,
+                "avg_rewrite_seconds": round(self.average_rewrite_seconds(), 3),
+                "saved_seconds": round(self.saved_seconds, 3)
+            }
+
+
+stats = RewriteStats()
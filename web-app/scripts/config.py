@@ -0,0 +1,96 @@
+import os
+import time
+import logging
+import threading
+import boto3
+
+logger = logging.getLogger(__name__)
+
+#Parameters created by the KendraStack in Systems Manager Parameter Store
+PARAMETER_NAMES = [
+    "genai_s3_bucket",
+    "genai_kendra_index_id",
+    "genai_s3_data_source_id"
+]
+
+#Values are refreshed in the background once older than this
+PARAMETERS_TTL = int(os.environ.get("GENAI_PARAMETERS_TTL", "300"))
+
+_values = {}
+_loaded_at = 0.0
+_refreshing = False
+_lock = threading.Lock()
+_ssm_client = None
+
+
+def _get_ssm_client():
+    global _ssm_client
+    if _ssm_client is None:
+        _ssm_client = boto3.client("ssm", region_name=boto3.Session().region_name)
+    return _ssm_client
+
+
+def _env_override(name):
+    """
+    An environment variable named after the parameter in upper case
+    (e.g. GENAI_S3_BUCKET) replaces the Parameter Store value.
+    """
+    return os.environ.get(name.upper())
+
+
+def _load():
+    global _values, _loaded_at, _refreshing
+    names = [name for name in PARAMETER_NAMES if _env_override(name) is None]
+    values = {}
+    try:
+        if names:
+            #A single GetParameters call resolves up to 10 parameters
+            response = _get_ssm_client().get_parameters(Names=names)
+            for parameter in response["Parameters"]:
+                values[parameter["Name"]] = parameter["Value"]
+            if response.get("InvalidParameters"):
+                logger.warning("Parameters not found: %s", response["InvalidParameters"])
+        with _lock:
+            _values = values
+            _loaded_at = time.time()
+    finally:
+        with _lock:
+            _refreshing = False
+
+
+def _refresh_in_background():
+    global _refreshing
+    with _lock:
+        if _refreshing:
+            return
+        _refreshing = True
+    threading.Thread(target=_load, daemon=True).start()
+
+
+def get_parameters():
+    """
+    Returns all genai_* parameters as a dict. The first call loads them with one
+    GetParameters request, later calls are served from memory. Once the TTL has
+    expired the cached values are still returned while a background thread refreshes them.
+    """
+    if not _loaded_at:
+        _load()
+    elif time.time() - _loaded_at > PARAMETERS_TTL:
+        _refresh_in_background()
+
+    values = dict(_values)
+    for name in PARAMETER_NAMES:
+        override = _env_override(name)
+        if override is not None:
+            values[name] = override
+    return values
+
+
+def get_parameter(name):
+    """
+    This function retrieves a specific value from Systems Manager"s ParameterStore.
+    """
+    value = _env_override(name)
+    if value is not None:
+        return value
+    return get_parameters()[name]
@@ -0,0 +1,103 @@
+import os
+import re
+import math
+import logging
+from typing import List
+
+from langchain.schema import BaseRetriever, Document
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+
+logger = logging.getLogger(__name__)
+
+#Maximum number of tokens of retrieved passages placed in the <documents> block
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("GENAI_CONTEXT_TOKEN_BUDGET", "1500"))
+#Passages sharing this fraction of their word shingles with a kept passage of the same source are dropped
+OVERLAP_THRESHOLD = 0.7
+SHINGLE_SIZE = 5
+#A passage is truncated to fill the remaining budget only if at least this many tokens are left
+MIN_TRUNCATED_TOKENS = 50
+#Claude tokens average about 4 characters of English text
+CHARS_PER_TOKEN = 4
+
+#Kendra Retrieve returns a confidence bucket rather than a numeric score
+SCORE_RANKS = {
+    "VERY_HIGH": 0,
+    "HIGH": 1,
+    "MEDIUM": 2,
+    "LOW": 3,
+    "NOT_AVAILABLE": 4
+}
+
+
+def count_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def shingles(text):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def score_rank(document):
+    return SCORE_RANKS.get(document.metadata.get("score"), len(SCORE_RANKS))
+
+
+def pack_documents(documents, token_budget=CONTEXT_TOKEN_BUDGET, count=count_tokens):
+    """
+    Selects the passages sent to the LLM: ranks them by Kendra score (keeping
+    Kendra's order within a score), drops passages overlapping an already selected
+    passage of the same source and stops at the token budget, truncating the
+    last passage when enough budget is left. Re-ranked passages keep their order.
+    """
+    if all("rerank_score" in d.metadata for d in documents):
+        ranked = list(enumerate(documents))
+    else:
+        ranked = sorted(enumerate(documents), key=lambda item: (score_rank(item[1]), item[0]))
+
+    packed, kept_shingles = [], []
+    used = 0
+    tokens_in = sum(count(d.page_content) for d in documents)
+    for _, document in ranked:
+        source = document.metadata.get("source")
+        document_shingles = shingles(document.page_content)
+        duplicate = any(
+            source == other_source and len(document_shingles & other) >= OVERLAP_THRESHOLD * len(document_shingles)
+            for other_source, other in kept_shingles
+        )
+        if duplicate:
+            continue
+
+        tokens = count(document.page_content)
+        remaining = token_budget - used
+        if tokens > remaining:
+            if remaining < MIN_TRUNCATED_TOKENS:
+                break
+            document = Document(
+                page_content=document.page_content[:remaining * CHARS_PER_TOKEN],
+                metadata=document.metadata
+            )
+            tokens = count(document.page_content)
+
+        packed.append(document)
+        kept_shingles.append((source, document_shingles))
+        used += tokens
+
+    logger.info("Context packing: %s -> %s passages, %s -> %s tokens (%s saved)",
+                len(documents), len(packed), tokens_in, used, tokens_in - used)
+    return packed
+
+
+class ContextPackingRetriever(BaseRetriever):
+    """
+    Wraps a retriever and packs its results within a token budget before they
+    reach the combine-docs prompt.
+    """
+
+    retriever: BaseRetriever
+    token_budget: int = CONTEXT_TOKEN_BUDGET
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        documents = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return pack_documents(documents, self.token_budget)
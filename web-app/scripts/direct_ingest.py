@@ -0,0 +1,168 @@
+import os
+import time
+import logging
+
+from scripts.document_metadata import batch_attributes, write_sidecar
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+#BatchPutDocument accepts up to 10 documents and 50 MB per call
+BATCH_MAX_DOCUMENTS = 10
+BATCH_MAX_BYTES = 50 * MB
+#Larger files are left to the S3 data source sync
+DIRECT_INGEST_MAX_FILE_BYTES = int(os.environ.get("GENAI_DIRECT_INGEST_MAX_BYTES", str(5 * MB)))
+#BatchPutDocument only queues the documents, their status is polled until they are indexed
+INDEXING_TIMEOUT = int(os.environ.get("GENAI_DIRECT_INGEST_TIMEOUT", "60"))
+INDEXING_POLL_SECONDS = 2
+#BatchGetDocumentStatus accepts up to 10 documents per call
+STATUS_BATCH_SIZE = 10
+INDEXED_STATUSES = ("INDEXED", "UPDATED")
+FAILED_STATUSES = ("FAILED", "UPDATE_FAILED")
+
+CONTENT_TYPES = {
+    "pdf": "PDF",
+    "doc": "MS_WORD",
+    "docx": "MS_WORD",
+    "ppt": "PPT",
+    "pptx": "PPT",
+    "xls": "MS_EXCEL",
+    "xlsx": "MS_EXCEL",
+    "csv": "CSV",
+    "txt": "PLAIN_TEXT"
+}
+
+def content_type(file_name):
+    return CONTENT_TYPES.get(file_name.rsplit(".", 1)[-1].lower())
+
+
+def can_ingest_directly(uploaded_file):
+    return content_type(uploaded_file.name) is not None and uploaded_file.size <= DIRECT_INGEST_MAX_FILE_BYTES
+
+
+def document_id(bucket_name, key):
+    #Same ID as the S3 connector, so the next crawl updates the document instead of duplicating it
+    return f"s3://{bucket_name}/{key}"
+
+
+def source_uri(region_name, bucket_name, key):
+    return f"https://s3.{region_name}.amazonaws.com/{bucket_name}/{key}"
+
+
+def batches(documents):
+    """
+    Splits documents into batches within the BatchPutDocument limits.
+    """
+    batch, batch_bytes = [], 0
+    for document in documents:
+        size = len(document["Blob"])
+        if batch and (len(batch) == BATCH_MAX_DOCUMENTS or batch_bytes + size > BATCH_MAX_BYTES):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(document)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def wait_until_indexed(kendra_client, index_id, document_ids, timeout=None, poll_seconds=None):
+    """
+    Polls BatchGetDocumentStatus until every document is indexed, failed, or
+    the timeout is reached.
+
+    :return: (IDs of the indexed documents, {ID: reason} of the failed or still processing ones)
+    """
+    timeout = INDEXING_TIMEOUT if timeout is None else timeout
+    poll_seconds = INDEXING_POLL_SECONDS if poll_seconds is None else poll_seconds
+    waiting = list(document_ids)
+    indexed, failed = [], {}
+    deadline = time.time() + timeout
+    while waiting:
+        for start in range(0, len(waiting), STATUS_BATCH_SIZE):
+            response = kendra_client.batch_get_document_status(
+                IndexId=index_id,
+                DocumentInfoList=[{"DocumentId": document_id} for document_id in waiting[start:start + STATUS_BATCH_SIZE]]
+            )
+            for status in response.get("DocumentStatusList", []):
+                if status["DocumentStatus"] in INDEXED_STATUSES:
+                    indexed.append(status["DocumentId"])
+                elif status["DocumentStatus"] in FAILED_STATUSES:
+                    failed[status["DocumentId"]] = status.get("FailureReason") or status["DocumentStatus"]
+            for error in response.get("Errors", []):
+                failed[error["DocumentId"]] = error.get("ErrorMessage") or error.get("ErrorCode")
+        waiting = [document_id for document_id in waiting if document_id not in indexed and document_id not in failed]
+        if waiting and time.time() + poll_seconds > deadline:
+            for document_id in waiting:
+                failed[document_id] = f"not indexed after {timeout} seconds"
+            break
+        if waiting:
+            time.sleep(poll_seconds)
+    return indexed, failed
+
+
+def ingest(kendra_client, s3_client, index_id, bucket_name, region_name, files, prefix="Documents", attributes=None):
+    """
+    Pushes small, supported files straight into the Kendra index with BatchPutDocument,
+    waits until Kendra indexed them and writes the matching Metadata/ sidecar so the
+    S3 data source stays consistent. Files that failed or are still processing at the
+    timeout are left to the S3 sync. The files must already be uploaded under prefix.
+
+    :param files: objects with a name attribute, a size attribute and a getbuffer() method
+    :param attributes: optional {file name: document attributes} (see scripts.document_metadata)
+    :return: (names of the ingested files, names of the files left to the S3 sync,
+              {file name: error} of the ingested files whose sidecar could not be written)
+    """
+    documents, fallback = [], []
+    file_attributes = {}
+    for uploaded_file in files:
+        if not can_ingest_directly(uploaded_file):
+            fallback.append(uploaded_file.name)
+            continue
+        key = prefix + "/" + uploaded_file.name
+        file_attributes[uploaded_file.name] = {
+            **(attributes or {}).get(uploaded_file.name, {}),
+            "_source_uri": source_uri(region_name, bucket_name, key)
+        }
+        documents.append({
+            "Id": document_id(bucket_name, key),
+            "Title": uploaded_file.name,
+            "Blob": bytes(uploaded_file.getbuffer()),
+            "ContentType": content_type(uploaded_file.name),
+            "Attributes": batch_attributes(file_attributes[uploaded_file.name])
+        })
+
+    names = {document["Id"]: document["Title"] for document in documents}
+    failed = set()
+    for batch in batches(documents):
+        try:
+            response = kendra_client.batch_put_document(IndexId=index_id, Documents=batch)
+            for failure in response.get("FailedDocuments", []):
+                logger.warning("BatchPutDocument failed for %s: %s", failure["Id"], failure.get("ErrorMessage"))
+                failed.add(failure["Id"])
+        except Exception as e:
+            logger.error("BatchPutDocument failed: %s", e)
+            failed.update(document["Id"] for document in batch)
+
+    queued = [document["Id"] for document in documents if document["Id"] not in failed]
+    if queued:
+        _, not_indexed = wait_until_indexed(kendra_client, index_id, queued)
+        for failed_id, reason in not_indexed.items():
+            logger.warning("Document %s was not indexed: %s", failed_id, reason)
+        failed.update(not_indexed)
+
+    ingested, sidecar_errors = [], {}
+    for document in documents:
+        if document["Id"] in failed:
+            fallback.append(document["Title"])
+            continue
+        ingested.append(names[document["Id"]])
+        #The document is already searchable, only its attributes are lost at the next S3 sync
+        try:
+            write_sidecar(s3_client, bucket_name, prefix + "/" + document["Title"], document["Id"],
+                          document["Title"], document["ContentType"], file_attributes[document["Title"]])
+        except Exception as e:
+            logger.error("Metadata sidecar of %s could not be written: %s", document["Title"], e)
+            sidecar_errors[document["Title"]] = e
+
+    return ingested, fallback, sidecar_errors
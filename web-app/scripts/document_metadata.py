@@ -0,0 +1,114 @@
+import os
+import json
+from datetime import datetime, timedelta, timezone
+
+METADATA_FOLDER = "Metadata"
+
+#Custom index field (see KendraStack) holding the file size in bytes
+SIZE_ATTRIBUTE = "file_size"
+#Categories offered when uploading and filtering, the seed documents use the service names
+CATEGORIES = [c.strip() for c in os.environ.get(
+    "GENAI_DOCUMENT_CATEGORIES",
+    "General,Amazon EC2 Auto Scaling,Amazon S3,Amazon VPC,AWS Lambda"
+).split(",") if c.strip()]
+
+#Python type of an attribute value -> Kendra DocumentAttributeValue field
+VALUE_TYPES = [
+    (bool, None),
+    (int, "LongValue"),
+    (datetime, "DateValue"),
+    (list, "StringListValue"),
+    (str, "StringValue")
+]
+
+
+def metadata_key(key):
+    return f"{METADATA_FOLDER}/{key}.metadata.json"
+
+
+def file_type(file_name):
+    return file_name.rsplit(".", 1)[-1].lower() if "." in file_name else ""
+
+
+def document_attributes(file_name, size, category=None, owner=None, uploaded_at=None, source_uri=None):
+    """
+    Kendra attributes of an uploaded document: category, owner (_authors),
+    upload date (_created_at), file type and size.
+    """
+    attributes = {
+        "_created_at": uploaded_at or datetime.now(timezone.utc),
+        "_file_type": file_type(file_name),
+        SIZE_ATTRIBUTE: size
+    }
+    if category:
+        attributes["_category"] = category
+    if owner:
+        attributes["_authors"] = [owner]
+    if source_uri:
+        attributes["_source_uri"] = source_uri
+    return attributes
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def sidecar(document_id, title, content_type, attributes):
+    """
+    Body of the Metadata/<key>.metadata.json file read by the S3 data source.
+    """
+    metadata = {
+        "DocumentId": document_id,
+        "Title": title,
+        "Attributes": {name: _json_value(value) for name, value in attributes.items()}
+    }
+    if content_type:
+        metadata["ContentType"] = content_type
+    return json.dumps(metadata).encode("utf-8")
+
+
+def write_sidecar(s3_client, bucket_name, key, document_id, title, content_type, attributes):
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=metadata_key(key),
+        Body=sidecar(document_id, title, content_type, attributes),
+        ContentType="application/json"
+    )
+
+
+def batch_attributes(attributes):
+    """
+    Attributes in the typed list format of BatchPutDocument.
+    """
+    typed = []
+    for name, value in attributes.items():
+        for python_type, field in VALUE_TYPES:
+            if isinstance(value, python_type):
+                if field is not None:
+                    typed.append({"Key": name, "Value": {field: value}})
+                break
+    return typed
+
+
+def attribute_filter(category=None, days=None, file_type=None):
+    """
+    Kendra AttributeFilter restricting retrieval to a category, to documents
+    uploaded in the last days, and/or to a file type. None when unfiltered.
+    The date is rounded to the day so the filter, and the chain built with it,
+    stays the same for a whole day.
+    """
+    filters = []
+    if category:
+        filters.append({"EqualsTo": {"Key": "_category", "Value": {"StringValue": category}}})
+    if days:
+        since = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+        filters.append({"GreaterThanOrEquals": {"Key": "_created_at", "Value": {"DateValue": since.isoformat()}}})
+    if file_type:
+        filters.append({"EqualsTo": {"Key": "_file_type", "Value": {"StringValue": file_type}}})
+    if not filters:
+        return None
+    if len(filters) == 1:
+        return filters[0]
+    return {"AndAllFilters": filters}
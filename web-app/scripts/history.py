@@ -0,0 +1,80 @@
+import os
+import re
+from collections import deque
+
+from scripts.context_packer import CHARS_PER_TOKEN, count_tokens
+
+#Tokens of chat history (summary included) passed to the condense-question prompt
+HISTORY_TOKEN_BUDGET = int(os.environ.get("GENAI_HISTORY_TOKEN_BUDGET", "800"))
+SUMMARY_TOKEN_BUDGET = 200
+#Turns kept verbatim at most, older ones are folded into the summary
+MAX_TURNS = 5
+
+SUMMARY_QUESTION = "What did we talk about earlier?"
+
+
+def first_sentence(text):
+    match = re.match(r"\s*(.+?[.!?])(\s|$)", text, re.S)
+    return (match.group(1) if match else text).strip()
+
+
+class ChatHistory:
+    """
+    Chat history bounded by a token budget. The most recent turns are kept
+    verbatim in a ring buffer, older turns are rolled into a compact summary
+    so the condense-question prompt stays the same size over long sessions.
+
+    The summary is extractive by default (each question with the first sentence
+    of its answer). A summarize(previous_summary, question, answer) callable can
+    be given to produce it with an LLM instead.
+    """
+
+    def __init__(self, token_budget=HISTORY_TOKEN_BUDGET, summary_budget=SUMMARY_TOKEN_BUDGET,
+                 max_turns=MAX_TURNS, summarize=None):
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.max_turns = max_turns
+        self.summarize = summarize
+        self.turns = deque()
+        self.summary = ""
+
+    def __len__(self):
+        return len(self.turns)
+
+    def tokens(self):
+        return count_tokens(self.summary) + sum(count_tokens(q) + count_tokens(a) for q, a in self.turns)
+
+    def _fold(self, question, answer):
+        if self.summarize is not None:
+            self.summary = self.summarize(self.summary, question, answer)
+        else:
+            line = f"Q: {question.strip()} A: {first_sentence(answer)}"
+            self.summary = (self.summary + "\n" + line).strip()
+
+    def _trim_summary(self, limit):
+        #Oldest summary lines are dropped first
+        lines = self.summary.split("\n")
+        while len(lines) > 1 and count_tokens("\n".join(lines)) > limit:
+            lines.pop(0)
+        self.summary = "\n".join(lines)[-max(limit, 0) * CHARS_PER_TOKEN:] if limit > 0 else ""
+
+    def add(self, question, answer):
+        self.turns.append((question, answer))
+        while len(self.turns) > 1 and (len(self.turns) > self.max_turns or self.tokens() > self.token_budget):
+            self._fold(*self.turns.popleft())
+        turn_tokens = self.tokens() - count_tokens(self.summary)
+        self._trim_summary(min(self.summary_budget, self.token_budget - turn_tokens))
+
+    def clear(self):
+        self.turns.clear()
+        self.summary = ""
+
+    def as_tuples(self):
+        """
+        History in the (question, answer) format expected by the chain,
+        the summary being presented as the first turn.
+        """
+        history = list(self.turns)
+        if self.summary:
+            history.insert(0, (SUMMARY_QUESTION, self.summary))
+        return history
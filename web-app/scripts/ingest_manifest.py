@@ -0,0 +1,194 @@
+import os
+import io
+import gzip
+import json
+import time
+import hashlib
+import logging
+import threading
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+#Outside of the Documents/ inclusion prefix, so the data source never crawls it
+MANIFEST_KEY = os.environ.get("GENAI_INGEST_MANIFEST_KEY", "Manifest/ingest-manifest.json.gz")
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def content_hash(buffer):
+    """
+    SHA-256 of an in-memory buffer, hashed chunk by chunk without copying it.
+    """
+    view = memoryview(buffer).cast("B")
+    digest = hashlib.sha256()
+    for start in range(0, len(view), HASH_CHUNK_BYTES):
+        digest.update(view[start:start + HASH_CHUNK_BYTES])
+    return digest.hexdigest()
+
+
+class HashingReader(io.RawIOBase):
+    """
+    Wraps a readable stream and hashes the bytes read through it, so a download
+    can be hashed while it is streamed to S3.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._digest = hashlib.sha256()
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self._digest.update(data)
+        self.size += len(data)
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+class IngestManifest:
+    """
+    Content hash, size, upload time and last indexed time of every document key,
+    with the uploads and sync jobs avoided so far. Kept as a single gzipped JSON
+    object in the bucket; saving merges the local changes into the latest copy.
+
+    Entries are {"h": sha256, "s": size, "u": uploaded at, "i": indexed at or None},
+    plus "j", the sync job started while the entry was pending. The entry is only
+    marked indexed once that job succeeded.
+    """
+
+    def __init__(self, s3_client, bucket_name, key=MANIFEST_KEY):
+        self.s3 = s3_client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.entries = {}
+        self.stats = {}
+        self._changed = {}
+        self._stats_changes = {}
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            body = self.s3.get_object(Bucket=self.bucket_name, Key=self.key)["Body"].read()
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return {"entries": {}, "stats": {}}
+            raise
+        return json.loads(gzip.decompress(body))
+
+    def load(self):
+        manifest = self._read()
+        with self._lock:
+            self.entries = {**manifest.get("entries", {}), **self._changed}
+            stats = manifest.get("stats", {})
+            self.stats = {name: stats.get(name, 0) + self._stats_changes.get(name, 0)
+                          for name in set(stats) | set(self._stats_changes)}
+        return self
+
+    def save(self):
+        with self._lock:
+            if not self._changed and not self._stats_changes:
+                return
+            changed, stats_changes = dict(self._changed), dict(self._stats_changes)
+        manifest = self._read()
+        manifest.setdefault("entries", {}).update(changed)
+        stats = manifest.setdefault("stats", {})
+        for name, value in stats_changes.items():
+            stats[name] = stats.get(name, 0) + value
+        body = gzip.compress(json.dumps(manifest, separators=(",", ":")).encode("utf-8"))
+        self.s3.put_object(Bucket=self.bucket_name, Key=self.key, Body=body,
+                           ContentType="application/json", ContentEncoding="gzip")
+        with self._lock:
+            for key in changed:
+                if self._changed.get(key) == changed[key]:
+                    del self._changed[key]
+            for name, value in stats_changes.items():
+                self._stats_changes[name] -= value
+                if not self._stats_changes[name]:
+                    del self._stats_changes[name]
+            #Changes recorded while saving stay on top of the saved copy
+            self.entries = {**manifest["entries"], **self._changed}
+            self.stats = {name: stats.get(name, 0) + self._stats_changes.get(name, 0)
+                          for name in set(stats) | set(self._stats_changes)}
+
+    def _set(self, key, entry):
+        self.entries[key] = entry
+        self._changed[key] = entry
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + value
+            self._stats_changes[name] = self._stats_changes.get(name, 0) + value
+
+    def is_unchanged(self, key, digest, size):
+        entry = self.entries.get(key)
+        return entry is not None and entry["h"] == digest and entry["s"] == size
+
+    def record_upload(self, key, digest, size, indexed=False):
+        now = int(time.time())
+        with self._lock:
+            self._set(key, {"h": digest, "s": size, "u": now, "i": now if indexed else None})
+
+    def record_skip(self, size):
+        self.count("uploads_avoided")
+        self.count("bytes_avoided", size)
+
+    def _pending(self):
+        return [key for key, entry in self.entries.items() if entry["i"] is None or entry["i"] < entry["u"]]
+
+    def pending(self):
+        """
+        Keys uploaded since they were last indexed.
+        """
+        with self._lock:
+            return self._pending()
+
+    def needs_sync(self, failed_job_ids=()):
+        """
+        Pending keys no sync job was started for yet, or whose job failed
+        (failed_job_ids). Keys waiting for a running job are left out, that
+        job picks them up.
+        """
+        with self._lock:
+            return [key for key in self._pending()
+                    if self.entries[key].get("j") is None or self.entries[key]["j"] in failed_job_ids]
+
+    def assign_job(self, job_id):
+        """
+        Records the sync job started for the pending keys.
+        """
+        with self._lock:
+            for key in self._pending():
+                self._set(key, {**self.entries[key], "j": job_id})
+
+    def mark_jobs_indexed(self, job_ids):
+        """
+        Marks indexed the pending keys whose sync job is in job_ids (jobs that
+        SUCCEEDED). Returns the number of keys marked.
+        """
+        now = int(time.time())
+        with self._lock:
+            keys = [key for key in self._pending() if self.entries[key].get("j") in job_ids]
+            for key in keys:
+                self._set(key, {**self.entries[key], "i": now})
+        return len(keys)
+
+    def mark_indexed(self, keys=None):
+        """
+        Sets the indexed time of the given keys, by default of every pending key.
+        """
+        now = int(time.time())
+        with self._lock:
+            for key in self._pending() if keys is None else keys:
+                if key in self.entries:
+                    self._set(key, {**self.entries[key], "i": now})
@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("genai.metrics")
+
+#Print CloudWatch Embedded Metric Format records on stdout (collected by the awslogs driver)
+EMF_ENABLED = os.environ.get("GENAI_METRICS_EMF", "false").lower() == "true"
+EMF_NAMESPACE = os.environ.get("GENAI_METRICS_NAMESPACE", "GenAiRag")
+#Port of the Prometheus text endpoint, disabled when empty
+METRICS_PORT = os.environ.get("GENAI_METRICS_PORT", "")
+
+CONDENSE_TAG = "condense"
+
+
+class RequestTrace:
+    """
+    Wall time and counters of the stages of one request.
+    """
+
+    def __init__(self, name="rag"):
+        self.name = name
+        self.started = time.time()
+        self.total_seconds = None
+        self.stages = {}
+        self.attributes = {}
+
+    def add(self, stage, **values):
+        entry = self.stages.setdefault(stage, {})
+        for key, value in values.items():
+            entry[key] = entry.get(key, 0) + value
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    @contextmanager
+    def stage(self, stage):
+        start_time = time.time()
+        try:
+            yield self
+        finally:
+            self.add(stage, seconds=time.time() - start_time)
+
+    def finish(self):
+        if self.total_seconds is None:
+            self.total_seconds = time.time() - self.started
+            export(self)
+        return self
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "total_seconds": self.total_seconds,
+            "stages": self.stages,
+            "attributes": self.attributes
+        }
+
+
+class MetricsRegistry:
+    """
+    Process-wide aggregates of the exported traces, rendered in the
+    Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def record(self, trace):
+        with self._lock:
+            self._inc(("genai_requests_total", trace.name, ""), 1)
+            self._inc(("genai_request_seconds_sum", trace.name, ""), trace.total_seconds)
+            if trace.attributes.get("cache_hit"):
+                self._inc(("genai_cache_hits_total", trace.name, ""), 1)
+            if trace.attributes.get("degraded"):
+                self._inc(("genai_degraded_total", trace.name, ""), 1)
+            for stage, values in trace.stages.items():
+                for key, value in values.items():
+                    self._inc((f"genai_stage_{key}_total", trace.name, stage), value)
+            route = trace.attributes.get("route")
+            if route:
+                self._inc(("genai_route_requests_total", trace.name, "", route), 1)
+                self._inc(("genai_route_cost_usd_total", trace.name, "", route), trace.attributes.get("cost_usd", 0))
+                self._inc(("genai_route_generate_seconds_total", trace.name, "", route),
+                          trace.stages.get("generate", {}).get("seconds", 0))
+
+    def _inc(self, key, value):
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for (metric, name, stage, *route), value in sorted(self._counters.items()):
+                labels = f'request="{name}"' + (f',stage="{stage}"' if stage else "") + "".join(f',route="{r}"' for r in route)
+                lines.append(f"{metric}{{{labels}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def emf_record(trace):
+    values = {}
+    values["TotalSeconds"] = trace.total_seconds
+    for stage, stage_values in trace.stages.items():
+        for key, value in stage_values.items():
+            name = stage.capitalize() + "".join(part.capitalize() for part in key.split("_"))
+            values[name] = value
+    metrics = [{"Name": name, "Unit": "Seconds" if name.endswith("Seconds") else "Count"} for name in values]
+    return {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{"Namespace": EMF_NAMESPACE, "Dimensions": [["Request"]], "Metrics": metrics}]
+        },
+        "Request": trace.name,
+        **values,
+        **{k: v for k, v in trace.attributes.items() if isinstance(v, (str, bool, int, float))}
+    }
+
+
+def export(trace):
+    """
+    Writes the trace as a structured log line, to the metrics registry and,
+    when enabled, as an EMF record.
+    """
+    logger.info(json.dumps(trace.as_dict(), default=str))
+    registry.record(trace)
+    if EMF_ENABLED:
+        print(json.dumps(emf_record(trace), default=str), flush=True)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """
+    Serves /metrics on the given port in a daemon thread, once per process.
+    Does nothing when no port is configured.
+    """
+    global _metrics_server
+    if not port:
+        return None
+    with _metrics_server_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+            threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+        return _metrics_server
@@ -4,10 +4,30 @@ from langchain.chains import ConversationalRetrievalChain
 from langchain.prompts import PromptTemplate
 from langchain.llms.bedrock import Bedrock
 from langchain.chains.llm import LLMChain
+from langchain.chains.conversational_retrieval.base import _get_chat_history
 import sys
 import os
+import time
+import logging
 import boto3
 
+from langchain.schema import Document
+
+from scripts import condense
+from scripts import answer_cache
+from scripts import clients
+from scripts import config
+from scripts.context_packer import ContextPackingRetriever
+from scripts import retrieval_cache
+from scripts import reranker
+from scripts import resilience
+from scripts import router
+from scripts import batch
+from scripts import document_metadata
+from scripts.history import ChatHistory
+from scripts.instrumentation import RequestTrace, CONDENSE_TAG
+from scripts.trace_callbacks import TraceCallbackHandler
+
 class bcolors:
     HEADER = '\033[95m'
     OKBLUE = '\033[94m'
@@ -19,25 +39,35 @@ class bcolors:
     BOLD = '\033[1m'
     UNDERLINE = '\033[4m'
 
-MAX_HISTORY_LENGTH = 5
+#Model, kwargs and prompt of every route are defined in scripts.router, the chain itself uses the default route
+MODEL_ID = router.ROUTES[router.DEFAULT_ROUTE]["model_id"]
+MODEL_KWARGS = router.ROUTES[router.DEFAULT_ROUTE]["model_kwargs"]
 
+#Dumps every prompt to stdout, per-stage timings are exported by scripts.instrumentation instead
+VERBOSE = os.environ.get("GENAI_VERBOSE", "false").lower() == "true"
 
-region_name = boto3.Session().region_name
+#Optional smaller/faster model used only to rephrase follow up questions
+REWRITE_MODEL_ID = os.environ.get("GENAI_REWRITE_MODEL_ID")
+REWRITE_MODEL_KWARGS = {"max_tokens_to_sample":100,"temperature":0,"anthropic_version":"bedrock-2023-05-31"}
 
-def get_parameter(name):
-    """
-    This function retrieves a specific value from Systems Manager"s ParameterStore.
-    """     
-    ssm_client = boto3.client("ssm",region_name=region_name)
-    response = ssm_client.get_parameter(Name=name)
-    value = response["Parameter"]["Value"]
-    
-    return value
+#Answers returned instead of an error when Bedrock or Kendra are throttling
+BUSY_ANSWER = "The AI service is busy right now and could not answer. The most relevant documents are listed in the sources."
+NO_SOURCES_ANSWER = "The knowledge base is busy right now, please try again in a moment."
 
+region_name = boto3.Session().region_name
 
-def build_chain():
+def build_chain(attribute_filter=None):
+  """
+  Builds the conversational retrieval chain. The chain holds no conversation state,
+  the chat history is passed on every call, so one chain can be shared by all sessions.
+  Bedrock and Kendra calls go through the pooled clients of scripts.clients.
+
+  attribute_filter is a Kendra AttributeFilter applied to every Retrieve call,
+  see scripts.document_metadata.attribute_filter.
+  """
   region = region_name
-  kendra_index_id = get_parameter("genai_kendra_index_id")
+  parameters = config.get_parameters()
+  kendra_index_id = parameters["genai_kendra_index_id"]
   #credentials_profile_name = os.environ['AWS_PROFILE']
 
   #print(credentials_profile_name)
@@ -46,32 +76,35 @@ def build_chain():
   llm = Bedrock(
       #credentials_profile_name=credentials_profile_name,
       region_name = region,
-      model_kwargs={"max_tokens_to_sample":300,"temperature":1,"top_k":250,"top_p":0.999,"anthropic_version":"bedrock-2023-05-31"},
-      model_id="anthropic.claude-v2"
+      client=clients.get_client("bedrock-runtime"),
+      model_kwargs=MODEL_KWARGS,
+      model_id=MODEL_ID,
+      streaming=True
   )
       
-  retriever = AmazonKendraRetriever(index_id=kendra_index_id,top_k=5,region_name=region)
+  condense_question_llm = None
+  if REWRITE_MODEL_ID:
+    condense_question_llm = Bedrock(
+        region_name = region,
+        client=clients.get_client("bedrock-runtime"),
+        model_kwargs=REWRITE_MODEL_KWARGS,
+        model_id=REWRITE_MODEL_ID
+    )
 
+  #With a re-ranker Kendra is asked for more candidates than the prompt takes
+  scorer = reranker.get_scorer()
+  top_k = reranker.RERANK_CANDIDATES if scorer is not None else 5
+  kendra_retriever = AmazonKendraRetriever(index_id=kendra_index_id,top_k=top_k,region_name=region,client=clients.get_client("kendra"),attribute_filter=attribute_filter)
+  #Repeated Retrieve calls are served from a cache, cleared when a data source sync completes
+  cache = retrieval_cache.watch_sync_jobs(clients.get_client("kendra"), kendra_index_id, parameters.get("genai_s3_data_source_id"))
+  retriever = retrieval_cache.CachingRetriever(retriever=kendra_retriever, cache=cache)
+  if scorer is not None:
+    retriever = reranker.RerankingRetriever(retriever=retriever, scorer=scorer)
+  #Deduplicates and trims the Kendra passages to a token budget before they reach PROMPT
+  retriever = ContextPackingRetriever(retriever=retriever)
 
-  prompt_template = """Human: This is a friendly conversation between a human and an AI. 
-  The AI is talkative and provides specific details from its context but limits it to 240 tokens.
-  If the AI does not know the answer to a question, it truthfully says it 
-  does not know.
 
-  Assistant: OK, got it, I'll be a talkative truthful AI assistant.
-
-  Human: Here are a few documents in <documents> tags:
-  <documents>
-  {context}
-  </documents>
-  Based on the above documents, provide a detailed answer for, {question} 
-  Answer "don't know" if not present in the document. 
-
-  Assistant:
-  """
-  PROMPT = PromptTemplate(
-      template=prompt_template, input_variables=["context", "question"]
-  )
+  PROMPT = router.build_prompt(router.DEFAULT_ROUTE)
 
   condense_qa_template = """{chat_history}
   Human:
@@ -90,33 +123,245 @@ def build_chain():
         llm=llm, 
         retriever=retriever, 
         condense_question_prompt=standalone_question_prompt, 
+        condense_question_llm=condense_question_llm, 
         return_source_documents=True, 
         combine_docs_chain_kwargs={"prompt":PROMPT},
-        verbose=True)
+        verbose=VERBOSE)
 
   # qa = ConversationalRetrievalChain.from_llm(llm=llm, retriever=retriever, qa_prompt=PROMPT, return_source_documents=True)
   return qa
 
 
-def run_chain(chain, prompt: str, history=[]):
-  return chain({"question": prompt, "chat_history": history})
+def condense_question(chain, prompt: str, history=[], callbacks=None, trace=None):
+  """
+  Rephrases a follow up question into a standalone question with the chain's
+  question generator. The LLM round trip is skipped when there is no history
+  or the question already looks self-contained. A skipped rewrite is counted
+  in the trace's condense stage with the latency it saved.
+  """
+  if not condense.needs_rewrite(prompt, history):
+    if history:
+      saved = condense.stats.record_skip()
+      if trace is not None:
+        trace.add("condense", skipped=1, saved_seconds=saved)
+    return prompt
+
+  start_time = time.time()
+  get_chat_history = chain.get_chat_history or _get_chat_history
+  try:
+    response = chain.question_generator.invoke(
+      {"question": prompt, "chat_history": get_chat_history(history)},
+      config={"callbacks": callbacks, "tags": [CONDENSE_TAG]})
+  except Exception as e:
+    if not resilience.is_overload_error(e):
+      raise
+    logging.warning("Question rewrite skipped: %s", e)
+    return prompt
+  condense.stats.record_rewrite(time.time() - start_time)
+  return response["text"].strip()
+
+
+def degraded_result(chain, question, error, docs=None):
+  """
+  Result returned when a service is throttling or its circuit is open: the
+  sources only, retrieved from the cache when Kendra is unavailable too.
+  """
+  logging.warning("Degraded answer for %r: %s", question, error)
+  if docs is None:
+    try:
+      docs = chain.retriever.invoke(question)
+    except Exception as e:
+      if not resilience.is_overload_error(e):
+        raise
+      docs = []
+  return {
+    "question": question,
+    "answer": BUSY_ANSWER if docs else NO_SOURCES_ANSWER,
+    "source_documents": docs,
+    "degraded": True
+  }
+
+
+def attribute_filter_of(chain):
+  retriever = chain.retriever
+  while retriever is not None:
+    if getattr(retriever, "attribute_filter", None):
+      return retriever.attribute_filter
+    retriever = getattr(retriever, "retriever", None)
+  return None
+
+
+def use_answer_cache(chain):
+  #Answers are cached by question only, so filtered chains neither read nor fill the cache
+  return chain is None or attribute_filter_of(chain) is None
+
+
+def cache_result(question, result, chain=None, model=None):
+  #Answers of a pinned route (model) are kept apart from the automatically routed ones
+  cache = answer_cache.get_cache()
+  if cache is not None and use_answer_cache(chain):
+    cache.set(question, {
+      "answer": result["answer"],
+      "source_documents": [{"page_content": d.page_content, "metadata": d.metadata} for d in result.get("source_documents", [])]
+    }, route=model)
+
+
+def cached_result(question, chain=None, model=None):
+  #Answers are dropped once a sync job completed, checked here too since cache hits skip the retriever
+  watcher = retrieval_cache.get_cache().watcher
+  if watcher is not None:
+    watcher.maybe_check()
+  cache = answer_cache.get_cache()
+  value = cache.get(question, route=model) if cache is not None and use_answer_cache(chain) else None
+  if value is None:
+    return None
+  return {
+    "question": question,
+    "answer": value["answer"],
+    "source_documents": [Document(**d) for d in value["source_documents"]]
+  }
+
+
+def route_prompt(chain, question, docs, model=None):
+  """
+  Picks the route of the question with scripts.router and returns it with
+  its LLM and the prompt filled with the retrieved passages.
+  """
+  route = router.choose_route(question, docs, model)
+  llm, prompt = router.get_model(chain, route)
+  context = "\n\n".join(d.page_content for d in docs)
+  return route, llm, prompt.format(context=context, question=question)
+
+
+def generate(chain, question, docs, model=None, callbacks=None, trace=None):
+  """
+  Answers a standalone question from already retrieved documents with the routed model.
+  """
+  route, llm, text = route_prompt(chain, question, docs, model)
+  answer = llm.invoke(text, config={"callbacks": callbacks})
+  if trace is not None:
+    router.record(trace, route)
+  return answer
+
+
+def run_chain(chain, prompt: str, history=[], trace=None, model=None):
+  """
+  Condenses the question, retrieves the passages and answers with the model
+  routed by scripts.router. model pins a route ("fast", "quality"), None routes automatically.
+  """
+  trace = trace or RequestTrace()
+  callbacks = [TraceCallbackHandler(trace)]
+
+  question = condense_question(chain, prompt, history, callbacks, trace)
+  result = cached_result(question, chain, model)
+  trace.set("cache_hit", result is not None)
+  if result is None:
+    docs = None
+    try:
+      docs = chain.retriever.invoke(question, config={"callbacks": callbacks})
+      answer = generate(chain, question, docs, model, callbacks, trace)
+      result = {"question": question, "answer": answer, "source_documents": docs}
+      cache_result(question, result, chain, model)
+    except Exception as e:
+      if not resilience.is_overload_error(e):
+        raise
+      result = degraded_result(chain, question, e, docs)
+
+  trace.set("degraded", result.get("degraded", False))
+  result["trace"] = trace.finish().as_dict()
+  return result
+
+
+def run_chain_stream(chain, prompt: str, history=[], trace=None, model=None):
+  """
+  Streaming variant of run_chain. Runs the same condense and retrieve steps as the
+  ConversationalRetrievalChain, then streams the answer from Bedrock
+  (InvokeModelWithResponseStream) instead of waiting for the full completion.
+
+  Yields {"token": str} for every chunk received, then a final
+  {"answer": str, "source_documents": list} shaped like the run_chain result.
+  The answering model is picked by scripts.router, as in run_chain.
+  The Bedrock client is taken from the chain's LLM, so a fake client exposing
+  invoke_model_with_response_stream can be injected with Bedrock(client=...).
+  """
+  trace = trace or RequestTrace()
+  callbacks = [TraceCallbackHandler(trace)]
+
+  question = condense_question(chain, prompt, history, callbacks, trace)
+  result = cached_result(question, chain, model)
+  trace.set("cache_hit", result is not None)
+  if result is not None:
+    yield {"token": result["answer"]}
+    result["trace"] = trace.finish().as_dict()
+    yield result
+    return
+
+  docs = None
+  answer = []
+  try:
+    docs = chain.retriever.invoke(question, config={"callbacks": callbacks})
+
+    route, llm, text = route_prompt(chain, question, docs, model)
+    for token in llm.stream(text, config={"callbacks": callbacks}):
+      answer.append(token)
+      yield {"token": token}
+    router.record(trace, route)
+
+    result = {"answer": "".join(answer), "source_documents": docs}
+    cache_result(question, result, chain, model)
+  except Exception as e:
+    if not resilience.is_overload_error(e):
+      raise
+    if answer:
+      #Keep what was already streamed to the user
+      result = {"answer": "".join(answer), "source_documents": docs, "degraded": True}
+    else:
+      result = degraded_result(chain, question, e, docs)
+      yield {"token": result["answer"]}
+
+  trace.set("degraded", result.get("degraded", False))
+  result["trace"] = trace.finish().as_dict()
+  yield result
 
 
 if __name__ == "__main__":
-  chat_history = []
-  qa = build_chain()
+  import argparse
+  parser = argparse.ArgumentParser(description="Chat with the documents, or answer a file of questions with --batch")
+  parser.add_argument("--batch", metavar="QUESTIONS", help="JSONL or CSV file of questions (question and optional id)")
+  parser.add_argument("--output", default="answers.jsonl", help="JSONL file the batch answers are appended to")
+  parser.add_argument("--workers", type=int, default=batch.BATCH_WORKERS, help="questions answered in parallel")
+  parser.add_argument("--model", choices=list(router.ROUTES), help="route every batch question to this model")
+  parser.add_argument("--restart", action="store_true", help="overwrite the output instead of resuming from it")
+  parser.add_argument("--category", help="only search documents of this category")
+  parser.add_argument("--days", type=int, help="only search documents uploaded in the last days")
+  args = parser.parse_args()
+
+  qa = build_chain(attribute_filter=document_metadata.attribute_filter(category=args.category, days=args.days))
+  if args.batch:
+    logging.basicConfig(level=logging.INFO)
+    #One trace per question would drown the progress lines
+    logging.getLogger("genai.metrics").setLevel(logging.WARNING)
+    qa.verbose = False
+    qa.combine_docs_chain.verbose = False
+    qa.question_generator.verbose = False
+    counts = batch.run_batch(sys.modules[__name__], qa, args.batch, args.output, args.workers, args.model, not args.restart)
+    print(bcolors.OKBLUE + f"{counts['answered']} answered, {counts['degraded']} degraded, {counts['failed']} failed, {counts['skipped']} already in {args.output}" + bcolors.ENDC)
+    sys.exit(1 if counts["failed"] else 0)
+
+  chat_history = ChatHistory()
   print(bcolors.OKBLUE + "Hello! How can I help you?" + bcolors.ENDC)
   print(bcolors.OKCYAN + "Ask a question, start a New search: or CTRL-D to exit." + bcolors.ENDC)
   print(">", end=" ", flush=True)
   for query in sys.stdin:
     if (query.strip().lower().startswith("new search:")):
       query = query.strip().lower().replace("new search:","")
-      chat_history = []
-    elif (len(chat_history) == MAX_HISTORY_LENGTH):
-      chat_history.pop(0)
-    result = run_chain(qa, query, chat_history)
-    chat_history.append((query, result["answer"]))
-    print(bcolors.OKGREEN + result['answer'] + bcolors.ENDC)
+      chat_history.clear()
+    print(bcolors.OKGREEN, end="", flush=True)
+    for result in run_chain_stream(qa, query, chat_history.as_tuples()):
+      if 'token' in result:
+        print(result['token'], end="", flush=True)
+    print(bcolors.ENDC)
+    chat_history.add(query, result["answer"])
     if 'source_documents' in result:
       print(bcolors.OKGREEN + 'Sources:')
       for d in result['source_documents']:
@@ -0,0 +1,51 @@
+import time
+import logging
+import threading
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+URL_EXPIRATION = 3600
+#Cached URLs are regenerated when less than this is left before they expire
+URL_REFRESH_MARGIN = 300
+
+
+class PresignedUrlCache:
+    """
+    Generates presigned GET URLs on demand and reuses them until shortly
+    before they expire.
+    """
+
+    def __init__(self, s3_client, expiration=URL_EXPIRATION, refresh_margin=URL_REFRESH_MARGIN):
+        self.s3_client = s3_client
+        self.expiration = expiration
+        self.refresh_margin = refresh_margin
+        self._urls = {}
+        self._lock = threading.Lock()
+
+    def get(self, bucket_name, key):
+        """
+        :return: Presigned URL as string. If error, returns None.
+        """
+        now = time.time()
+        with self._lock:
+            cached = self._urls.get((bucket_name, key))
+        if cached and cached[0] - self.refresh_margin > now:
+            return cached[1]
+
+        try:
+            url = self.s3_client.generate_presigned_url('get_object',
+                                                        Params={'Bucket': bucket_name,
+                                                                'Key': key},
+                                                        ExpiresIn=self.expiration)
+        except ClientError as e:
+            logger.error(e)
+            return None
+
+        with self._lock:
+            self._urls[(bucket_name, key)] = (now + self.expiration, url)
+        return url
+
+    def discard(self, bucket_name, key):
+        with self._lock:
+            self._urls.pop((bucket_name, key), None)
@@ -0,0 +1,146 @@
+import os
+import re
+import logging
+from typing import Any, List
+
+import numpy as np
+from langchain.schema import BaseRetriever, Document
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+
+from scripts.context_packer import SCORE_RANKS
+
+logger = logging.getLogger(__name__)
+
+#"bm25" (default), "cross-encoder" (needs GENAI_RERANKER_MODEL) or "off"
+RERANKER = os.environ.get("GENAI_RERANKER", "bm25")
+#Passages asked from Kendra when re-ranking, and passages kept for the prompt
+RERANK_CANDIDATES = int(os.environ.get("GENAI_RERANK_CANDIDATES", "25"))
+RERANK_TOP_N = int(os.environ.get("GENAI_RERANK_TOP_N", "5"))
+#Folder with model.onnx and tokenizer.json of a cross-encoder (e.g. ms-marco-MiniLM-L-6-v2 exported to ONNX)
+RERANKER_MODEL = os.environ.get("GENAI_RERANKER_MODEL", "")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+#Share of the final score given to Kendra's confidence bucket
+KENDRA_WEIGHT = 0.3
+CROSS_ENCODER_BATCH = 16
+CROSS_ENCODER_MAX_LENGTH = 256
+
+STOP_WORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "do", "does", "did", "what", "how", "why", "when",
+    "where", "which", "who", "can", "could", "i", "you", "my", "your", "of", "in", "on", "for", "to", "and",
+    "or", "with", "by", "it", "its", "this", "that", "at", "as", "from", "after", "before", "between"
+}
+
+
+def terms(text):
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in STOP_WORDS]
+
+
+def bm25_scores(query, passages, k1=BM25_K1, b=BM25_B):
+    """
+    BM25 score of every passage for the query, with document frequencies taken
+    from the candidate set itself. Vectorized over a passages x query-terms matrix.
+    """
+    query_terms = sorted(set(terms(query)))
+    if not passages or not query_terms:
+        return np.zeros(len(passages))
+    column = {term: i for i, term in enumerate(query_terms)}
+    tf = np.zeros((len(passages), len(query_terms)))
+    lengths = np.zeros(len(passages))
+    for row, passage in enumerate(passages):
+        passage_terms = terms(passage)
+        lengths[row] = len(passage_terms)
+        for term in passage_terms:
+            i = column.get(term)
+            if i is not None:
+                tf[row, i] += 1
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log(1 + (len(passages) - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * lengths / max(lengths.mean(), 1.0))
+    return (idf * tf * (k1 + 1) / (tf + norm[:, None])).sum(axis=1)
+
+
+class CrossEncoderScorer:
+    """
+    Scores (query, passage) pairs with a cross-encoder exported to ONNX, in
+    batches on the CPU. Needs pip install onnxruntime tokenizers.
+    """
+
+    def __init__(self, model_dir, batch_size=CROSS_ENCODER_BATCH, max_length=CROSS_ENCODER_MAX_LENGTH):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, "model.onnx"), providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+
+    def __call__(self, query, passages):
+        scores = []
+        for start in range(0, len(passages), self.batch_size):
+            encodings = self.tokenizer.encode_batch([(query, p) for p in passages[start:start + self.batch_size]])
+            inputs = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64)
+            }
+            logits = self.session.run(None, {k: v for k, v in inputs.items() if k in self.input_names})[0]
+            scores.append(logits.reshape(len(encodings), -1)[:, -1])
+        return np.concatenate(scores) if scores else np.zeros(0)
+
+
+def normalize(scores):
+    spread = scores.max() - scores.min() if len(scores) else 0
+    return (scores - scores.min()) / spread if spread > 0 else np.zeros(len(scores))
+
+
+def rerank(query, documents, top_n=RERANK_TOP_N, scorer=bm25_scores, kendra_weight=KENDRA_WEIGHT):
+    """
+    Re-scores the candidates with scorer(query, passages), blended with Kendra's
+    confidence bucket, and returns the best top_n with their rerank_score.
+    Ties keep Kendra's order.
+    """
+    if not documents:
+        return []
+    passages = [d.page_content for d in documents]
+    kendra = np.array([1 - min(SCORE_RANKS.get(d.metadata.get("score"), len(SCORE_RANKS)), len(SCORE_RANKS)) / len(SCORE_RANKS)
+                       for d in documents])
+    scores = (1 - kendra_weight) * normalize(np.asarray(scorer(query, passages), dtype=float)) + kendra_weight * kendra
+    order = np.argsort(-scores, kind="stable")[:top_n]
+    return [
+        Document(page_content=documents[i].page_content, metadata={**documents[i].metadata, "rerank_score": round(float(scores[i]), 4)})
+        for i in order
+    ]
+
+
+def get_scorer(kind=RERANKER, model_dir=RERANKER_MODEL):
+    """
+    Scorer of the configured re-ranker, None when re-ranking is off. Falls back
+    to BM25 when the cross-encoder or its dependencies are not available.
+    """
+    if kind == "off":
+        return None
+    if kind == "cross-encoder":
+        try:
+            return CrossEncoderScorer(model_dir)
+        except Exception as e:
+            logger.warning("Cross-encoder unavailable, using BM25: %s", e)
+    return bm25_scores
+
+
+class RerankingRetriever(BaseRetriever):
+    """
+    Wraps a retriever returning an over-fetched candidate set and keeps the
+    top_n passages after re-ranking them.
+    """
+
+    retriever: BaseRetriever
+    scorer: Any = bm25_scores
+    top_n: int = RERANK_TOP_N
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        documents = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return rerank(query, documents, self.top_n, self.scorer)
@@ -0,0 +1,185 @@
+import os
+import time
+import logging
+import threading
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+#Client side request rates, sized to the account quotas of the services
+RATE_LIMITS = {
+    "bedrock-runtime": float(os.environ.get("GENAI_BEDROCK_RPS", "5")),
+    "kendra": float(os.environ.get("GENAI_KENDRA_RPS", "2"))
+}
+#Longest wait for a rate limiter token before the call is given up
+RATE_LIMIT_TIMEOUT = 10
+
+#Consecutive failures opening the circuit, and time before a trial call is let through
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+
+OVERLOAD_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceQuotaExceededException",
+    "ServiceUnavailableException",
+    "ModelTimeoutException",
+    "ModelNotReadyException",
+    "InternalServerException"
+}
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a service whose circuit is open.
+    """
+
+
+class RateLimitTimeout(Exception):
+    """
+    Raised when no rate limiter token became available in time.
+    """
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing rate requests per second with bursts up to capacity.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=RATE_LIMIT_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive overload failures and rejects calls
+    until reset_timeout has passed, then lets one trial call through (half-open).
+    A trial without outcome (e.g. the call never left the client) is given up
+    after reset_timeout, so the breaker cannot stay stuck in half-open.
+    """
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._trial_started = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == "half-open" and self._trial and time.monotonic() - self._trial_started >= self.reset_timeout:
+                self._trial = False
+            if state == "open" or (state == "half-open" and self._trial):
+                raise CircuitOpenError(f"{self.name} circuit is open")
+            if state == "half-open":
+                self._trial = True
+                self._trial_started = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                if self.opened_at is None:
+                    logger.warning("%s circuit opened after %s failures", self.name, self.failures)
+                self.opened_at = time.monotonic()
+
+
+limiters = {service: TokenBucket(rate) for service, rate in RATE_LIMITS.items() if rate > 0}
+breakers = {service: CircuitBreaker(service) for service in RATE_LIMITS}
+
+
+def install(client, service_name):
+    """
+    Hooks the rate limiter and the circuit breaker of the service into a boto3
+    client through botocore events. Retries with backoff and jitter are handled
+    by the client's adaptive retry mode, the breaker only sees the final outcome.
+    """
+    limiter = limiters.get(service_name)
+    breaker = breakers.get(service_name)
+    if limiter is None and breaker is None:
+        return client
+
+    def before_call(**kwargs):
+        #The limiter is waited on first: a half-open breaker must only hand out its
+        #trial to a call that is actually sent, after-call then reports its outcome
+        if limiter is not None and not limiter.acquire():
+            raise RateLimitTimeout(f"{service_name} rate limit wait exceeded")
+        if breaker is not None:
+            breaker.before_call()
+
+    def after_call(http_response, parsed, **kwargs):
+        if breaker is None:
+            return
+        code = parsed.get("Error", {}).get("Code")
+        if code in OVERLOAD_ERROR_CODES or http_response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    def after_call_error(**kwargs):
+        if breaker is not None:
+            breaker.record_failure()
+
+    events = client.meta.events
+    events.register(f"before-call.{service_name}", before_call)
+    events.register(f"after-call.{service_name}", after_call)
+    events.register(f"after-call-error.{service_name}", after_call_error)
+    return client
+
+
+def is_overload_error(error):
+    """
+    True for throttling, unavailable service, open circuit or rate limiter timeouts,
+    including when wrapped by another exception (LangChain wraps Bedrock errors).
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (CircuitOpenError, RateLimitTimeout)):
+            return True
+        if isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in OVERLOAD_ERROR_CODES:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def status():
+    return {service: breaker.state for service, breaker in breakers.items()}
@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, List
+
+from langchain.schema import BaseRetriever, Document
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+
+from scripts import answer_cache
+from scripts.answer_cache import MemoryBackend, normalize_question
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_CACHE_TTL = int(os.environ.get("GENAI_RETRIEVAL_CACHE_TTL", "1800"))
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("GENAI_RETRIEVAL_CACHE_SIZE", "2000"))
+#Interval between two checks of the data source sync jobs
+SYNC_CHECK_SECONDS = 60
+#Developer Edition indexes allow about 4,000 queries per day
+DAILY_QUERY_QUOTA = int(os.environ.get("GENAI_KENDRA_DAILY_QUERY_QUOTA", "4000"))
+QUOTA_WARNING_RATIO = 0.8
+
+COMPLETED_STATUSES = ("SUCCEEDED", "INCOMPLETE")
+#Jobs whose documents are not all indexed and have to be synced again
+FAILED_STATUSES = ("FAILED", "ABORTED", "INCOMPLETE")
+
+
+class SyncCompletionWatcher:
+    """
+    Detects completed data source sync jobs by their execution ID. The check
+    is rate limited and runs in a background thread so lookups never wait on it.
+    The IDs of the recent jobs that SUCCEEDED are kept in succeeded_job_ids,
+    those that failed, were stopped or left documents out in failed_job_ids.
+    """
+
+    def __init__(self, kendra_client, index_id, data_source_id, on_sync_completed, interval=SYNC_CHECK_SECONDS):
+        self.kendra = kendra_client
+        self.index_id = index_id
+        self.data_source_id = data_source_id
+        self.listeners = [on_sync_completed]
+        self.interval = interval
+        self.last_job_id = None
+        self.succeeded_job_ids = set()
+        self.failed_job_ids = set()
+        self._initialized = False
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def recent_jobs(self):
+        response = self.kendra.list_data_source_sync_jobs(
+            Id=self.data_source_id,
+            IndexId=self.index_id,
+            MaxResults=5
+        )
+        return response.get("History", [])
+
+    def check(self):
+        try:
+            jobs = self.recent_jobs()
+        except Exception as e:
+            logger.error("Sync job check failed: %s", e)
+            return
+        job_id = next((job["ExecutionId"] for job in jobs if job["Status"] in COMPLETED_STATUSES), None)
+        with self._lock:
+            self.succeeded_job_ids = {job["ExecutionId"] for job in jobs if job["Status"] == "SUCCEEDED"}
+            self.failed_job_ids = {job["ExecutionId"] for job in jobs if job["Status"] in FAILED_STATUSES}
+            #The first check only records the current job, the cache was filled after it completed
+            changed = self._initialized and job_id != self.last_job_id
+            self._initialized = True
+            self.last_job_id = job_id
+        if changed:
+            logger.info("Sync job %s completed", job_id)
+            for listener in self.listeners:
+                try:
+                    listener(job_id)
+                except Exception as e:
+                    logger.error("Sync completion listener failed: %s", e)
+
+    def add_listener(self, on_sync_completed):
+        if on_sync_completed not in self.listeners:
+            self.listeners.append(on_sync_completed)
+
+    def maybe_check(self):
+        with self._lock:
+            if time.time() - self._checked_at < self.interval:
+                return
+            self._checked_at = time.time()
+        threading.Thread(target=self.check, daemon=True).start()
+
+
+class QuotaTracker:
+    """
+    Counts the Kendra queries issued in the last 24 hours and warns before
+    the index query quota is reached.
+    """
+
+    def __init__(self, daily_quota=DAILY_QUERY_QUOTA, warning_ratio=QUOTA_WARNING_RATIO):
+        self.daily_quota = daily_quota
+        self.warning_ratio = warning_ratio
+        self._queries = deque()
+        self._lock = threading.Lock()
+        self._warned = False
+
+    def record(self):
+        now = time.time()
+        with self._lock:
+            self._queries.append(now)
+            while self._queries and self._queries[0] < now - 86400:
+                self._queries.popleft()
+            used = len(self._queries)
+            warn = used >= self.daily_quota * self.warning_ratio
+            should_log = warn and not self._warned
+            self._warned = warn
+        if should_log:
+            logger.warning("Kendra query quota: %s of %s queries used in the last 24 hours", used, self.daily_quota)
+
+    def usage(self):
+        with self._lock:
+            used = len(self._queries)
+        return {"queries_24h": used, "daily_quota": self.daily_quota, "ratio": round(used / self.daily_quota, 3)}
+
+
+class LatencyTracker:
+    """
+    Rolling window of latencies with percentile lookups.
+    """
+
+    def __init__(self, size=500):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def count(self):
+        return len(self._samples)
+
+    def percentile(self, p):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def summary(self):
+        return {
+            "count": self.count(),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99)
+        }
+
+
+#Latency of the Retrieve calls that reached Kendra, cache hits excluded
+kendra_latency = LatencyTracker()
+
+
+class RetrievalCache:
+    """
+    LRU + TTL cache of retrieved documents, shared by every session of the process.
+    """
+
+    def __init__(self, max_size=RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL):
+        self.backend = MemoryBackend(max_size=max_size, ttl=ttl)
+        self.quota = QuotaTracker()
+        self.watcher = None
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, query, top_k, attribute_filter):
+        return json.dumps([normalize_question(query), top_k, attribute_filter], sort_keys=True, default=str)
+
+    def get(self, key):
+        if self.watcher is not None:
+            self.watcher.maybe_check()
+        documents = self.backend.get(key)
+        if documents is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return documents
+
+    def set(self, key, documents):
+        self.backend.set(key, documents)
+
+    def invalidate(self, job_id=None):
+        self.backend.invalidate()
+        logger.info("Retrieval cache invalidated (sync job %s)", job_id)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, **self.quota.usage()}
+
+
+class CachingRetriever(BaseRetriever):
+    """
+    Serves repeated Kendra Retrieve calls from a RetrievalCache, keyed on the
+    normalized query, top_k and attribute filter of the wrapped retriever.
+    """
+
+    retriever: Any
+    cache: Any
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        key = self.cache.key(query, getattr(self.retriever, "top_k", None), getattr(self.retriever, "attribute_filter", None))
+        documents = self.cache.get(key)
+        if documents is None:
+            self.cache.quota.record()
+            start_time = time.time()
+            documents = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+            kendra_latency.record(time.time() - start_time)
+            self.cache.set(key, documents)
+        return list(documents)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Returns the process-wide retrieval cache.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RetrievalCache()
+        return _cache
+
+
+def invalidate_answer_cache(job_id=None):
+    cache = answer_cache.get_cache()
+    if cache is not None:
+        cache.invalidate()
+
+
+def watch_sync_jobs(kendra_client, index_id, data_source_id):
+    """
+    Invalidates the process-wide retrieval and answer caches whenever a new sync
+    job of the data source completes. Every process building a chain (Streamlit
+    tasks, API tasks) watches the jobs, so each one clears its own caches.
+    """
+    cache = get_cache()
+    with _cache_lock:
+        if cache.watcher is None:
+            cache.watcher = SyncCompletionWatcher(kendra_client, index_id, data_source_id, cache.invalidate)
+            cache.watcher.add_listener(invalidate_answer_cache)
+    return cache
@@ -0,0 +1,166 @@
+import os
+import re
+import threading
+
+from langchain.llms.bedrock import Bedrock
+from langchain.prompts import PromptTemplate
+
+from scripts import clients
+from scripts.context_packer import count_tokens
+
+#"auto" picks the route per question, a route name sends every question to that route
+ROUTER_MODE = os.environ.get("GENAI_MODEL_ROUTER", "auto")
+DEFAULT_ROUTE = "quality"
+#Questions longer than this many words, or with more retrieved context tokens, go to the default route
+FAST_MAX_QUESTION_WORDS = 20
+FAST_MAX_CONTEXT_TOKENS = int(os.environ.get("GENAI_ROUTER_CONTEXT_TOKENS", "1000"))
+#Wording asking for an explanation or a comparison rather than a lookup
+LONG_FORM_PATTERN = re.compile(
+    r"\b(explain|describe|compare|comparison|difference|differences|why|how does|how do|how can|"
+    r"walk me through|step by step|steps|summarize|summary|pros and cons|advantages|best practices)\b",
+    re.IGNORECASE
+)
+
+QUALITY_PROMPT = """Human: This is a friendly conversation between a human and an AI. 
+  The AI is talkative and provides specific details from its context but limits it to 240 tokens.
+  If the AI does not know the answer to a question, it truthfully says it 
+  does not know.
+
+  Assistant: OK, got it, I'll be a talkative truthful AI assistant.
+
+  Human: Here are a few documents in <documents> tags:
+  <documents>
+  {context}
+  </documents>
+  Based on the above documents, provide a detailed answer for, {question} 
+  Answer "don't know" if not present in the document. 
+
+  Assistant:
+  """
+
+FAST_PROMPT = """
+
+Human: Here are a few documents in <documents> tags:
+<documents>
+{context}
+</documents>
+Using only the above documents, answer in a few sentences: {question}
+Answer "don't know" if not present in the documents.
+
+Assistant:"""
+
+#Model, model_kwargs, prompt and USD price per 1,000 input and output tokens of every route
+ROUTES = {
+    "quality": {
+        "provider": "anthropic",
+        "label": "Claude v2",
+        "model_id": "anthropic.claude-v2",
+        "model_kwargs": {"max_tokens_to_sample":300,"temperature":1,"top_k":250,"top_p":0.999,"anthropic_version":"bedrock-2023-05-31"},
+        "prompt": QUALITY_PROMPT,
+        "price": (0.008, 0.024)
+    },
+    "fast": {
+        "provider": "anthropic",
+        "label": "Claude Instant",
+        "model_id": os.environ.get("GENAI_FAST_MODEL_ID", "anthropic.claude-instant-v1"),
+        "model_kwargs": {"max_tokens_to_sample":200,"temperature":0,"top_p":0.999,"anthropic_version":"bedrock-2023-05-31"},
+        "prompt": FAST_PROMPT,
+        "price": (0.0008, 0.0024)
+    }
+}
+
+
+def choose_route(question, documents, selection=None):
+    """
+    Returns the route answering the question. An explicit selection wins, then
+    long or explanatory questions and large contexts go to the default route,
+    short lookups to the fast one.
+    """
+    selection = selection or ROUTER_MODE
+    if selection in ROUTES:
+        return selection
+    if len(question.split()) > FAST_MAX_QUESTION_WORDS or LONG_FORM_PATTERN.search(question):
+        return DEFAULT_ROUTE
+    if sum(count_tokens(d.page_content) for d in documents) > FAST_MAX_CONTEXT_TOKENS:
+        return DEFAULT_ROUTE
+    return "fast"
+
+
+def build_llm(route, streaming=True):
+    config = ROUTES[route]
+    return Bedrock(
+        client=clients.get_client("bedrock-runtime"),
+        model_kwargs=config["model_kwargs"],
+        model_id=config["model_id"],
+        streaming=streaming
+    )
+
+
+def build_prompt(route):
+    return PromptTemplate(template=ROUTES[route]["prompt"], input_variables=["context", "question"])
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_model(chain, route):
+    """
+    Returns the (llm, prompt) pair of a route. The default route is the
+    chain's own combine-docs LLM, the other ones are built once per process.
+    """
+    if route == DEFAULT_ROUTE:
+        llm_chain = chain.combine_docs_chain.llm_chain
+        return llm_chain.llm, llm_chain.prompt
+    with _models_lock:
+        if route not in _models:
+            _models[route] = (build_llm(route), build_prompt(route))
+        return _models[route]
+
+
+def cost(route, input_tokens, output_tokens):
+    input_price, output_price = ROUTES[route]["price"]
+    return (input_tokens * input_price + output_tokens * output_price) / 1000
+
+
+class RouteStats:
+    """
+    Per-route request count, generation time and cost of the process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, seconds, cost_usd):
+        with self._lock:
+            entry = self._routes.setdefault(route, {"requests": 0, "seconds": 0.0, "cost_usd": 0.0})
+            entry["requests"] += 1
+            entry["seconds"] += seconds
+            entry["cost_usd"] += cost_usd
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                route: {
+                    "requests": entry["requests"],
+                    "avg_seconds": round(entry["seconds"] / entry["requests"], 3),
+                    "cost_usd": round(entry["cost_usd"], 5)
+                }
+                for route, entry in self._routes.items()
+            }
+
+
+stats = RouteStats()
+
+
+def record(trace, route):
+    """
+    Adds the route and the cost of its generation to the trace and the route statistics.
+    """
+    generate = trace.stages.get("generate", {})
+    cost_usd = cost(route, generate.get("input_tokens", 0), generate.get("output_tokens", 0))
+    trace.set("route", route)
+    trace.set("model_id", ROUTES[route]["model_id"])
+    trace.set("cost_usd", round(cost_usd, 6))
+    stats.record(route, generate.get("seconds", 0.0), cost_usd)
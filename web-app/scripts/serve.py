@@ -0,0 +1,30 @@
+"""
+Entry point of the web-app container. Warms the process up, then starts
+Streamlit in the same process, so the sessions find the modules imported,
+the clients connected and the chain built. The port is only opened once
+the warm-up is done, which keeps the load balancer health check failing
+until then.
+
+    python -m scripts.serve Home.py --server.headless true
+
+Takes the arguments of streamlit run.
+"""
+import sys
+
+from streamlit.web import cli
+
+from scripts import instrumentation
+from scripts import warmup
+
+
+def main():
+    #Metrics are exported from the start, not only once a session opened the RAG page
+    instrumentation.start_metrics_server()
+    if warmup.WARMUP_ENABLED:
+        warmup.warm_up()
+    sys.argv = ["streamlit", "run", *sys.argv[1:]]
+    sys.exit(cli.main())
+
+
+if __name__ == "__main__":
+    main()
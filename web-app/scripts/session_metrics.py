@@ -0,0 +1,63 @@
+import sys
+import time
+import resource
+import threading
+
+#Sessions not seen for this long are no longer counted as active
+SESSION_IDLE_SECONDS = 1800
+
+
+def deep_sizeof(obj, seen=None):
+    """
+    Approximate memory used by an object and everything it references.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(i, seen) for i in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def process_rss_bytes():
+    #ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class SessionRegistry:
+    """
+    Tracks the state size of every Streamlit session served by this process.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def update(self, session_id, state):
+        size = deep_sizeof({k: state[k] for k in state.keys()})
+        with self._lock:
+            self._sessions[session_id] = (time.time(), size)
+        return size
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            for session_id, (last_seen, _) in list(self._sessions.items()):
+                if now - last_seen > SESSION_IDLE_SECONDS:
+                    del self._sessions[session_id]
+            sizes = [size for _, size in self._sessions.values()]
+
+        return {
+            "active_sessions": len(sizes),
+            "session_state_bytes_total": sum(sizes),
+            "session_state_bytes_avg": int(sum(sizes) / len(sizes)) if sizes else 0,
+            "process_max_rss_bytes": process_rss_bytes()
+        }
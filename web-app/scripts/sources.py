@@ -0,0 +1,92 @@
+import time
+import logging
+import threading
+from botocore.exceptions import ClientError
+
+from scripts import clients
+from scripts.presign import PresignedUrlCache
+from scripts.document_metadata import SIZE_ATTRIBUTE
+
+logger = logging.getLogger(__name__)
+
+#Object sizes rarely change, HEAD results are reused for this long
+SIZE_TTL = 3600
+
+
+class ObjectSizeCache:
+    """
+    Shared HEAD lookups of S3 object sizes, cached with a TTL.
+    """
+
+    def __init__(self, s3_client, ttl=SIZE_TTL):
+        self.s3_client = s3_client
+        self.ttl = ttl
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def get(self, bucket_name, key):
+        now = time.time()
+        with self._lock:
+            cached = self._sizes.get((bucket_name, key))
+        if cached and cached[0] > now:
+            return cached[1]
+
+        try:
+            size = self.s3_client.head_object(Bucket=bucket_name, Key=key)['ContentLength']
+        except ClientError as e:
+            logger.error(e)
+            return None
+
+        with self._lock:
+            self._sizes[(bucket_name, key)] = (now + self.ttl, size)
+        return size
+
+
+url_cache = PresignedUrlCache(clients.get_client("s3"))
+size_cache = ObjectSizeCache(clients.get_client("s3"))
+
+
+def describe_source(metadata):
+    """
+    Builds the display metadata of a source document once, when the answer is produced.
+
+    :param metadata: metadata of a source document returned by the retriever
+    :return: dict with title, bucket, key and size in bytes (None if unknown)
+    """
+    source = metadata['source']
+    #Sources are https://s3.<region>.amazonaws.com/<bucket>/<key>
+    bucket_name = source.split('/')[3]
+    key = source.split(bucket_name)[-1][1:]
+
+    size = metadata.get('document_attributes', {}).get(SIZE_ATTRIBUTE)
+    if size is None:
+        size = size_cache.get(bucket_name, key)
+
+    return {
+        'source': source,
+        'title': key.replace("Documents/", ""),
+        'bucket': bucket_name,
+        'key': key,
+        'size': size
+    }
+
+
+def describe_sources(documents):
+    """
+    Returns the display metadata of the distinct sources of a list of documents.
+    """
+    sources = []
+    seen = set()
+    for d in documents:
+        if d.metadata['source'] in seen:
+            continue
+        seen.add(d.metadata['source'])
+        sources.append(describe_source(d.metadata))
+    return sources
+
+
+def source_url(source):
+    """
+    Presigned URL of a source, cached until shortly before it expires.
+    """
+    return url_cache.get(source['bucket'], source['key'])
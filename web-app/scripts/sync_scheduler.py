@@ -0,0 +1,161 @@
+import time
+import logging
+import threading
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+#Sync requests received within this window are coalesced into a single sync job
+SYNC_WINDOW_SECONDS = 30
+#Interval used to poll a running sync job before starting the next one
+POLL_INTERVAL_SECONDS = 15
+
+RUNNING_STATUSES = ("SYNCING", "SYNCING_INDEXING", "STOPPING")
+
+
+class SyncScheduler:
+    """
+    Debounces Kendra data source sync requests. Every call to request() within
+    the window is folded into one StartDataSourceSyncJob, which is only started
+    once no other sync job of the data source is running (checked with
+    ListDataSourceSyncJobs, so jobs started by other tasks are respected too).
+
+    :param kendra_client: boto3 Kendra client, or a stub with the same methods
+    :param index_id: Kendra index ID
+    :param data_source_id: Kendra data source ID
+    :param on_sync_started: optional callables receiving the started job ID
+    """
+
+    def __init__(self, kendra_client, index_id, data_source_id, window=SYNC_WINDOW_SECONDS,
+                 poll_interval=POLL_INTERVAL_SECONDS, on_sync_started=()):
+        self.kendra = kendra_client
+        self.index_id = index_id
+        self.data_source_id = data_source_id
+        self.window = window
+        self.poll_interval = poll_interval
+        self.on_sync_started = list(on_sync_started)
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._first_request_at = None
+        self._worker = None
+        self.coalesced = 0
+        self.last_job_id = None
+        self.last_error = None
+        self._last_status = {}
+
+    def request(self):
+        """
+        Queues a sync request and returns immediately.
+        """
+        with self._lock:
+            self._pending += 1
+            if self._first_request_at is None:
+                self._first_request_at = time.time()
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+    def running_job(self):
+        response = self.kendra.list_data_source_sync_jobs(
+            Id=self.data_source_id,
+            IndexId=self.index_id,
+            MaxResults=5
+        )
+        for job in response.get("History", []):
+            if job["Status"] in RUNNING_STATUSES:
+                return job
+        return None
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._worker = None
+                    return
+                wait = self._first_request_at + self.window - time.time()
+            if wait > 0:
+                time.sleep(wait)
+                continue
+
+            requests = 0
+            try:
+                if self.running_job() is not None:
+                    time.sleep(self.poll_interval)
+                    continue
+
+                with self._lock:
+                    requests = self._pending
+                    self._pending = 0
+                    self._first_request_at = None
+
+                response = self.kendra.start_data_source_sync_job(
+                    Id=self.data_source_id,
+                    IndexId=self.index_id
+                )
+            except Exception as e:
+                if requests:
+                    #The job was not started, queue the requests again
+                    with self._lock:
+                        self._pending += requests
+                        self._first_request_at = self._first_request_at or time.time()
+                if isinstance(e, self.kendra.exceptions.ConflictException):
+                    #Another task started a sync in between
+                    logger.info("Sync job already running, %s request(s) queued again", requests)
+                else:
+                    logger.error("Sync scheduling failed: %s", e)
+                    with self._lock:
+                        self.last_error = str(e)
+                time.sleep(self.poll_interval)
+                continue
+
+            with self._lock:
+                self.last_job_id = response["ExecutionId"]
+                self.coalesced += requests - 1
+                self.last_error = None
+            logger.info("Started sync job %s for %s request(s)", self.last_job_id, requests)
+            for callback in self.on_sync_started:
+                try:
+                    callback(self.last_job_id)
+                except Exception as e:
+                    logger.error("Sync started callback %s failed: %s", getattr(callback, "__name__", callback), e)
+
+    def status(self):
+        """
+        Returns the scheduler state, the latest sync job and the index document count.
+        When Kendra cannot be reached (e.g. throttling), the job and index fields
+        are the last known ones.
+        """
+        with self._lock:
+            status = {
+                "pending_requests": self._pending,
+                "coalesced_requests": self.coalesced,
+                "last_job_id": self.last_job_id,
+                "last_error": self.last_error,
+                "indexed_documents": None,
+                **self._last_status
+            }
+
+        try:
+            kendra_status = {}
+            jobs = self.kendra.list_data_source_sync_jobs(
+                Id=self.data_source_id,
+                IndexId=self.index_id,
+                MaxResults=1
+            ).get("History", [])
+            if jobs:
+                kendra_status["job_status"] = jobs[0]["Status"]
+                kendra_status["job_started"] = jobs[0].get("StartTime")
+                kendra_status["job_metrics"] = jobs[0].get("Metrics", {})
+
+            index = self.kendra.describe_index(Id=self.index_id)
+            statistics = index.get("IndexStatistics", {}).get("TextDocumentStatistics", {})
+            kendra_status["indexed_documents"] = statistics.get("IndexedTextDocumentsCount")
+        except ClientError as e:
+            logger.warning("Sync status unavailable, showing the last known one: %s", e)
+            return status
+
+        with self._lock:
+            self._last_status = kendra_status
+        return {**status, **kendra_status}
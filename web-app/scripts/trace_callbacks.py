@@ -0,0 +1,59 @@
+import time
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+from scripts.context_packer import count_tokens, SCORE_RANKS
+from scripts.instrumentation import CONDENSE_TAG
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler filling a RequestTrace. LLM runs tagged "condense"
+    are the question rewrite, the other ones the answer generation. Only the
+    outermost retriever run is timed, the retrievers it wraps (re-ranking,
+    caching, Kendra) are nested runs at any depth.
+    """
+
+    def __init__(self, trace):
+        self.trace = trace
+        self._runs = {}
+        self._nested_retrievers = set()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, tags=None, **kwargs):
+        stage = "condense" if tags and CONDENSE_TAG in tags else "generate"
+        self._runs[run_id] = (stage, time.time(), False)
+        self.trace.add(stage, calls=1, input_tokens=sum(count_tokens(p) for p in prompts))
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        stage, start_time, seen = self._runs.get(run_id, (None, None, True))
+        if not seen:
+            self._runs[run_id] = (stage, start_time, True)
+            self.trace.add(stage, first_token_seconds=time.time() - start_time)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        stage, start_time, _ = self._runs.pop(run_id, ("generate", time.time(), True))
+        output_tokens = sum(count_tokens(g.text) for generations in response.generations for g in generations)
+        self.trace.add(stage, seconds=time.time() - start_time, output_tokens=output_tokens)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id in self._runs or parent_run_id in self._nested_retrievers:
+            self._nested_retrievers.add(run_id)
+        else:
+            self._runs[run_id] = ("retrieve", time.time(), True)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._nested_retrievers.discard(run_id)
+        self._runs.pop(run_id, None)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        if run_id in self._nested_retrievers:
+            self._nested_retrievers.discard(run_id)
+            return
+        if run_id not in self._runs:
+            return
+        _, start_time, _ = self._runs.pop(run_id)
+        ranks = [SCORE_RANKS.get(d.metadata.get("score"), len(SCORE_RANKS)) for d in documents]
+        self.trace.add("retrieve", seconds=time.time() - start_time, calls=1, results=len(documents))
+        if ranks:
+            best = min(ranks)
+            self.trace.set("top_score", next((k for k, v in SCORE_RANKS.items() if v == best), None))
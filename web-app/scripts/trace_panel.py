@@ -0,0 +1,19 @@
+import streamlit as st
+
+
+def write_trace(trace):
+    """
+    Renders a request trace (RequestTrace or its as_dict()) as a collapsible panel.
+    """
+    if hasattr(trace, "as_dict"):
+        trace = trace.as_dict()
+
+    with st.expander(f"Request trace: {round(trace['total_seconds'] or 0, 2)} seconds"):
+        for stage, values in trace["stages"].items():
+            details = ", ".join(
+                f"{key.replace('_', ' ')}: {round(value, 3) if isinstance(value, float) else value}"
+                for key, value in values.items()
+            )
+            st.caption(f"**{stage}** - {details}")
+        for key, value in trace["attributes"].items():
+            st.caption(f"{key.replace('_', ' ')}: {value}")
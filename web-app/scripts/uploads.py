@@ -0,0 +1,134 @@
+import io
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+#Files uploaded at the same time, each one split in up to max_concurrency parts in flight
+MAX_PARALLEL_FILES = 4
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * MB,
+    multipart_chunksize=8 * MB,
+    max_concurrency=4,
+    use_threads=True
+)
+
+
+class MemoryViewReader(io.RawIOBase):
+    """
+    Read-only, seekable file object over a memoryview, so an in-memory upload
+    can be streamed to S3 without writing it to disk or copying the whole buffer.
+    """
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast("B")
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = len(self._view) + offset
+        self._pos = max(0, min(self._pos, len(self._view)))
+        return self._pos
+
+    def readinto(self, b):
+        chunk = self._view[self._pos:self._pos + len(b)]
+        n = len(chunk)
+        b[:n] = chunk
+        self._pos += n
+        return n
+
+
+class UploadBatch:
+    """
+    Uploads files to S3 through a bounded thread pool and tracks progress and
+    errors per file. Progress callbacks run in the transfer threads, so callers
+    poll progress() from their own thread instead of being called back.
+
+    :param s3_client: boto3 S3 client
+    :param bucket_name: destination bucket
+    :param files: objects with a name attribute and a getbuffer() method (Streamlit UploadedFile)
+    :param prefix: key prefix of the uploaded files
+    """
+
+    def __init__(self, s3_client, bucket_name, files, prefix="Documents", max_workers=MAX_PARALLEL_FILES):
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.files = files
+        self.prefix = prefix
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._state = {}
+        self._futures = []
+
+    def key(self, file_name):
+        return self.prefix + "/" + file_name
+
+    def _callback(self, file_name):
+        def callback(bytes_transferred):
+            with self._lock:
+                self._state[file_name]["sent"] += bytes_transferred
+        return callback
+
+    def _upload(self, uploaded_file):
+        file_name = uploaded_file.name
+        try:
+            self.s3_client.upload_fileobj(
+                MemoryViewReader(uploaded_file.getbuffer()),
+                self.bucket_name,
+                self.key(file_name),
+                Config=TRANSFER_CONFIG,
+                Callback=self._callback(file_name)
+            )
+            status, error = "done", None
+        except Exception as e:
+            logger.error("Upload of %s failed: %s", file_name, e)
+            status, error = "failed", str(e)
+        with self._lock:
+            self._state[file_name]["status"] = status
+            self._state[file_name]["error"] = error
+
+    def start(self):
+        for uploaded_file in self.files:
+            self._state[uploaded_file.name] = {
+                "size": uploaded_file.size,
+                "sent": 0,
+                "status": "uploading",
+                "error": None
+            }
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._futures = [executor.submit(self._upload, f) for f in self.files]
+        executor.shutdown(wait=False)
+        return self
+
+    def done(self):
+        return all(f.done() for f in self._futures)
+
+    def wait(self):
+        for f in self._futures:
+            f.result()
+        return self.progress()
+
+    def progress(self):
+        """
+        Returns {file_name: {"size", "sent", "status", "error"}}, status being
+        uploading, done or failed.
+        """
+        with self._lock:
+            return {name: dict(state) for name, state in self._state.items()}
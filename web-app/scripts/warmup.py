@@ -0,0 +1,106 @@
+import os
+import json
+import logging
+import importlib
+import threading
+
+from scripts import clients
+from scripts import config
+from scripts.instrumentation import RequestTrace, start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+#Warm-up run by scripts.serve and the API server before they accept requests, "false" to skip it
+WARMUP_ENABLED = os.environ.get("GENAI_WARMUP", "true").lower() == "true"
+#One Retrieve of this text opens the Kendra connection, it counts against the daily query quota
+WARMUP_QUERY = os.environ.get("GENAI_WARMUP_QUERY", "What is this knowledge base about?")
+#A 1 token completion opens the Bedrock connection. It is billed, "false" skips it
+WARMUP_BEDROCK = os.environ.get("GENAI_WARMUP_BEDROCK", "true").lower() == "true"
+
+#Modules imported by the pages and the API, langchain and numpy being the slowest
+PRELOAD_MODULES = [
+    "scripts.kendra_chat_bedrock_claudev2",
+    "scripts.sources",
+    "scripts.session_metrics",
+    "scripts.direct_ingest",
+    "scripts.uploads",
+    "scripts.sync_scheduler",
+    "scripts.catalog"
+]
+CLIENTS = ["bedrock-runtime", "kendra", "s3"]
+WARMUP_PROMPT = "\n\nHuman: Hello\n\nAssistant:"
+
+_chain = None
+_lock = threading.Lock()
+
+
+def get_chain():
+    """
+    Unfiltered chain shared by the process, built by the warm-up or on first use.
+    """
+    global _chain
+    if _chain is None:
+        with _lock:
+            if _chain is None:
+                bedrock_claudev2 = importlib.import_module("scripts.kendra_chat_bedrock_claudev2")
+                _chain = bedrock_claudev2.build_chain()
+    return _chain
+
+
+def _open_kendra(index_id):
+    clients.get_client("kendra").retrieve(IndexId=index_id, QueryText=WARMUP_QUERY, PageSize=1)
+
+
+def _open_bedrock(bedrock_claudev2):
+    body = {**bedrock_claudev2.MODEL_KWARGS, "prompt": WARMUP_PROMPT, "max_tokens_to_sample": 1}
+    response = clients.get_client("bedrock-runtime").invoke_model(
+        modelId=bedrock_claudev2.MODEL_ID, body=json.dumps(body),
+        accept="application/json", contentType="application/json")
+    response["body"].read()
+
+
+def warm_up(modules=PRELOAD_MODULES):
+    """
+    Imports the application modules, resolves the parameters, creates the
+    pooled clients, builds the shared chain, then fires one Retrieve and one
+    1 token completion so their connections are open before the first user.
+    Network failures are logged and do not stop the start, the first request
+    then opens the connections itself. Returns the timed RequestTrace.
+    """
+    trace = RequestTrace("warmup")
+    with trace.stage("import"):
+        for module in modules:
+            importlib.import_module(module)
+    with trace.stage("parameters"):
+        parameters = config.get_parameters()
+    with trace.stage("clients"):
+        for service_name in CLIENTS:
+            clients.get_client(service_name)
+    with trace.stage("chain"):
+        get_chain()
+
+    steps = [("retrieve", _open_kendra, parameters["genai_kendra_index_id"])]
+    if WARMUP_BEDROCK:
+        steps.append(("generate", _open_bedrock, importlib.import_module("scripts.kendra_chat_bedrock_claudev2")))
+    for stage, step, argument in steps:
+        try:
+            with trace.stage(stage):
+                step(argument)
+        except Exception as e:
+            logger.warning("Warm-up %s failed: %s", stage, e)
+            trace.set(f"{stage}_error", type(e).__name__)
+
+    trace.finish()
+    logger.info("Warm-up finished in %.2f seconds", trace.total_seconds)
+    return trace
+
+
+def prepare():
+    """
+    Starts the metrics server (GENAI_METRICS_PORT), runs the warm-up when
+    enabled and returns the shared chain.
+    """
+    start_metrics_server()
+    if WARMUP_ENABLED:
+        warm_up()
+    return get_chain()
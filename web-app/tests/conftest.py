@@ -0,0 +1,8 @@
+import os
+
+#The chain modules read their configuration at import time, as in benchmarks/
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("GENAI_KENDRA_INDEX_ID", "test-index")
+os.environ.setdefault("GENAI_S3_DATA_SOURCE_ID", "test-data-source")
+os.environ.setdefault("GENAI_S3_BUCKET", "test-bucket")
+os.environ.setdefault("GENAI_ANSWER_CACHE", "off")
@@ -0,0 +1,65 @@
+import time
+import asyncio
+
+from benchmarks.fakes import FakeKendra, FakeBedrock
+from scripts import async_pipeline
+from scripts import clients
+from scripts import retrieval_cache
+from scripts import router
+import scripts.kendra_chat_bedrock_claudev2 as bedrock_claudev2
+
+HISTORY = [("What is S3 Versioning?", "S3 Versioning keeps multiple variants of an object.")]
+
+
+def build_chain(monkeypatch, kendra_latency=0.0):
+    kendra = FakeKendra(latency=kendra_latency, jitter=0)
+    clients.set_client("kendra", kendra)
+    clients.set_client("bedrock-runtime", FakeBedrock(first_token_latency=0, tokens_per_second=100000))
+    monkeypatch.setattr(retrieval_cache, "_cache", None)
+    monkeypatch.setattr(router, "_models", {})
+    monkeypatch.setattr(async_pipeline, "stats", dict.fromkeys(async_pipeline.stats, 0))
+    return bedrock_claudev2.build_chain(), kendra
+
+
+def slow_rewrite(seconds, rewritten=None):
+    def condense_question(chain, prompt, history=[], callbacks=None, trace=None):
+        time.sleep(seconds)
+        return rewritten or prompt
+    return condense_question
+
+
+def test_raw_question_is_retrieved_while_it_is_rewritten(monkeypatch):
+    chain, kendra = build_chain(monkeypatch, kendra_latency=0.3)
+    monkeypatch.setattr(bedrock_claudev2, "condense_question", slow_rewrite(0.3))
+
+    start_time = time.time()
+    result = asyncio.run(async_pipeline.run_chain_async(chain, "How do I restore it?", HISTORY))
+
+    #Rewrite and Retrieve overlap instead of adding up to 0.6 seconds
+    assert time.time() - start_time < 0.55
+    assert async_pipeline.stats["speculative_hits"] == 1
+    assert kendra.calls == 1
+    assert result["trace"]["attributes"]["speculative_retrieve"] is True
+
+
+def test_rewrite_with_new_terms_is_retrieved_again(monkeypatch):
+    chain, kendra = build_chain(monkeypatch)
+    monkeypatch.setattr(bedrock_claudev2, "condense_question",
+                        slow_rewrite(0.05, "How do I restore a previous version of an S3 object?"))
+
+    result = asyncio.run(async_pipeline.run_chain_async(chain, "How do I restore it?", HISTORY))
+
+    assert async_pipeline.stats["speculative_misses"] == 1
+    assert kendra.calls == 2
+    assert result["trace"]["attributes"]["speculative_retrieve"] is False
+
+
+def test_cache_hits_are_not_counted_in_the_hedge_latency(monkeypatch):
+    chain, kendra = build_chain(monkeypatch)
+    before = retrieval_cache.kendra_latency.count()
+
+    for _ in range(3):
+        asyncio.run(async_pipeline.retrieve(chain, "What is S3 Versioning?"))
+
+    assert kendra.calls == 1
+    assert retrieval_cache.kendra_latency.count() == before + 1
@@ -0,0 +1,96 @@
+import pytest
+
+from benchmarks.fakes import FakeKendra, FakeBedrock, ANSWER
+from scripts import answer_cache
+from scripts import clients
+from scripts import instrumentation
+from scripts import retrieval_cache
+from scripts import router
+import scripts.kendra_chat_bedrock_claudev2 as bedrock_claudev2
+
+
+def build_chain(monkeypatch, bedrock):
+    kendra = FakeKendra(latency=0, jitter=0)
+    clients.set_client("kendra", kendra)
+    clients.set_client("bedrock-runtime", bedrock)
+    #Fresh retrieval cache, so every test calls the fake Kendra
+    monkeypatch.setattr(retrieval_cache, "_cache", None)
+    #The routed models hold the client they were built with
+    monkeypatch.setattr(router, "_models", {})
+    return bedrock_claudev2.build_chain(), kendra
+
+
+@pytest.fixture
+def memory_answer_cache(monkeypatch):
+    cache = answer_cache.AnswerCache(answer_cache.MemoryBackend())
+    monkeypatch.setattr(answer_cache, "CACHE_BACKEND", "memory")
+    monkeypatch.setattr(answer_cache, "_cache", cache)
+    return cache
+
+
+def test_tokens_are_streamed_in_order_then_the_result(monkeypatch):
+    bedrock = FakeBedrock(first_token_latency=0, tokens_per_second=100000)
+    chain, kendra = build_chain(monkeypatch, bedrock)
+
+    items = list(bedrock_claudev2.run_chain_stream(chain, "What is S3 Versioning?"))
+
+    tokens, result = items[:-1], items[-1]
+    assert all(set(item) == {"token"} for item in tokens)
+    assert "".join(item["token"] for item in tokens).strip() == ANSWER
+    assert result["answer"].strip() == ANSWER
+    assert result["source_documents"]
+    assert "S3 Versioning" in result["source_documents"][0].page_content
+    assert result["trace"]["attributes"]["cache_hit"] is False
+    assert result["trace"]["attributes"]["degraded"] is False
+    assert "degraded" not in result
+    #Only the outermost of the nested retrievers is counted
+    assert result["trace"]["stages"]["retrieve"]["calls"] == 1
+    assert result["trace"]["stages"]["retrieve"]["results"] == len(result["source_documents"])
+    assert kendra.calls == 1
+    assert bedrock.calls == 1
+
+
+def test_cached_answer_is_streamed_without_bedrock(monkeypatch, memory_answer_cache):
+    bedrock = FakeBedrock(first_token_latency=0, tokens_per_second=100000)
+    chain, kendra = build_chain(monkeypatch, bedrock)
+    first = list(bedrock_claudev2.run_chain_stream(chain, "What is S3 Versioning?"))[-1]
+
+    items = list(bedrock_claudev2.run_chain_stream(chain, "what is s3 versioning"))
+
+    assert items[0] == {"token": first["answer"]}
+    result = items[-1]
+    assert len(items) == 2
+    assert result["answer"] == first["answer"]
+    assert [d.page_content for d in result["source_documents"]] == [d.page_content for d in first["source_documents"]]
+    assert result["trace"]["attributes"]["cache_hit"] is True
+    assert bedrock.calls == 1
+    assert kendra.calls == 1
+
+
+def test_throttled_bedrock_returns_the_sources_only(monkeypatch):
+    bedrock = FakeBedrock(first_token_latency=0, error_rate=1.0)
+    chain, kendra = build_chain(monkeypatch, bedrock)
+
+    items = list(bedrock_claudev2.run_chain_stream(chain, "What is S3 Versioning?"))
+
+    assert items[0] == {"token": bedrock_claudev2.BUSY_ANSWER}
+    result = items[-1]
+    assert result["degraded"] is True
+    assert result["answer"] == bedrock_claudev2.BUSY_ANSWER
+    assert result["source_documents"]
+    assert result["trace"]["attributes"]["degraded"] is True
+
+
+def test_skipped_rewrite_is_recorded_in_the_trace_and_metrics(monkeypatch):
+    bedrock = FakeBedrock(first_token_latency=0, tokens_per_second=100000)
+    chain, _ = build_chain(monkeypatch, bedrock)
+    registry = instrumentation.MetricsRegistry()
+    monkeypatch.setattr(instrumentation, "registry", registry)
+    history = [("What is S3 Versioning?", "S3 Versioning keeps multiple variants of an object.")]
+
+    result = list(bedrock_claudev2.run_chain_stream(chain, "How long can a Lambda function run?", history))[-1]
+
+    condense = result["trace"]["stages"]["condense"]
+    assert condense["skipped"] == 1
+    assert condense["saved_seconds"] > 0
+    assert 'genai_stage_skipped_total{request="rag",stage="condense"} 1' in registry.render()
@@ -0,0 +1,69 @@
+from benchmarks.fakes import FakeS3
+from scripts import direct_ingest
+
+
+class UploadedFile:
+
+    def __init__(self, name, content):
+        self.name = name
+        self.size = len(content)
+        self._content = content
+
+    def getbuffer(self):
+        return memoryview(self._content)
+
+
+class QueueingKendra:
+    """
+    Accepts every document, then reports them PROCESSING for a number of status
+    calls before the given final status.
+    """
+
+    def __init__(self, final_status=None, processing_calls=1):
+        self.final_status = final_status or {}
+        self.processing_calls = processing_calls
+        self.status_calls = 0
+
+    def batch_put_document(self, IndexId, Documents):
+        return {"FailedDocuments": []}
+
+    def batch_get_document_status(self, IndexId, DocumentInfoList):
+        self.status_calls += 1
+        statuses = []
+        for info in DocumentInfoList:
+            status = "PROCESSING"
+            if self.status_calls > self.processing_calls:
+                status = self.final_status.get(info["DocumentId"], "INDEXED")
+            statuses.append({"DocumentId": info["DocumentId"], "DocumentStatus": status})
+        return {"DocumentStatusList": statuses, "Errors": []}
+
+
+def ingest(kendra, files, **kwargs):
+    return direct_ingest.ingest(kendra, FakeS3(), "index", "bucket", "us-east-1", files, **kwargs)
+
+
+def test_files_are_reported_ingested_once_indexed(monkeypatch):
+    monkeypatch.setattr(direct_ingest, "INDEXING_POLL_SECONDS", 0)
+    kendra = QueueingKendra(processing_calls=2)
+
+    ingested, fallback, sidecar_errors = ingest(kendra, [UploadedFile("a.txt", b"alpha")])
+
+    assert ingested == ["a.txt"]
+    assert fallback == []
+    assert sidecar_errors == {}
+    assert kendra.status_calls == 3
+
+
+def test_failed_and_slow_documents_are_left_to_the_sync(monkeypatch):
+    monkeypatch.setattr(direct_ingest, "INDEXING_POLL_SECONDS", 0)
+    failed_id = direct_ingest.document_id("bucket", "Documents/b.txt")
+    kendra = QueueingKendra(final_status={failed_id: "FAILED"})
+
+    ingested, fallback, _ = ingest(kendra, [UploadedFile("a.txt", b"alpha"), UploadedFile("b.txt", b"beta")])
+    assert ingested == ["a.txt"]
+    assert fallback == ["b.txt"]
+
+    indexed, not_indexed = direct_ingest.wait_until_indexed(QueueingKendra(processing_calls=100), "index", ["doc"],
+                                                            timeout=0, poll_seconds=0)
+    assert indexed == []
+    assert "doc" in not_indexed
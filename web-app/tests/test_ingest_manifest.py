@@ -0,0 +1,57 @@
+from benchmarks.fakes import FakeS3
+from scripts.ingest_manifest import IngestManifest
+
+BUCKET = "test-bucket"
+
+
+def test_save_merges_the_changes_of_two_writers():
+    s3 = FakeS3()
+    first = IngestManifest(s3, BUCKET).load()
+    second = IngestManifest(s3, BUCKET).load()
+    first.record_upload("Documents/a.pdf", "hash-a", 10)
+    first.count("uploads_avoided")
+    second.record_upload("Documents/b.pdf", "hash-b", 20)
+    second.count("uploads_avoided", 2)
+
+    first.save()
+    second.save()
+
+    saved = IngestManifest(s3, BUCKET).load()
+    assert set(saved.entries) == {"Documents/a.pdf", "Documents/b.pdf"}
+    assert saved.stats["uploads_avoided"] == 3
+    #The second writer sees the first one's entry after its save
+    assert "Documents/a.pdf" in second.entries
+
+
+def test_entries_are_indexed_only_once_their_job_succeeded():
+    manifest = IngestManifest(FakeS3(), BUCKET).load()
+    manifest.record_upload("Documents/a.pdf", "hash-a", 10)
+    manifest.assign_job("job-1")
+
+    assert manifest.mark_jobs_indexed({"job-0"}) == 0
+    assert manifest.pending() == ["Documents/a.pdf"]
+    assert manifest.mark_jobs_indexed({"job-1"}) == 1
+    assert manifest.pending() == []
+
+
+def test_keys_waiting_for_a_running_job_do_not_need_a_sync():
+    manifest = IngestManifest(FakeS3(), BUCKET).load()
+    manifest.record_upload("Documents/a.pdf", "hash-a", 10)
+    manifest.assign_job("job-1")
+
+    assert manifest.pending() == ["Documents/a.pdf"]
+    assert manifest.needs_sync() == []
+    assert manifest.needs_sync(failed_job_ids={"job-1"}) == ["Documents/a.pdf"]
+
+    #A new upload of the same key is synced again
+    manifest.record_upload("Documents/a.pdf", "hash-a2", 11)
+    assert manifest.needs_sync() == ["Documents/a.pdf"]
+
+
+def test_unchanged_content_is_detected_by_hash_and_size():
+    manifest = IngestManifest(FakeS3(), BUCKET).load()
+    manifest.record_upload("Documents/a.pdf", "hash-a", 10)
+
+    assert manifest.is_unchanged("Documents/a.pdf", "hash-a", 10)
+    assert not manifest.is_unchanged("Documents/a.pdf", "hash-b", 10)
+    assert not manifest.is_unchanged("Documents/b.pdf", "hash-a", 10)
@@ -0,0 +1,91 @@
+import os
+import sys
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from benchmarks.fakes import FakeS3
+
+#The bootstrap Lambda imports the shared modules at the top level, as laid out in its asset (see stack/kendra_stack.py)
+WEB_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(WEB_APP_DIR, "..", "lambda", "bootstrap_kendra"), os.path.join(WEB_APP_DIR, "scripts")]
+
+import init_kendra
+from document_metadata import metadata_key
+from ingest_manifest import IngestManifest
+
+BUCKET = "test-bucket"
+DOCUMENTS = {"/guide.pdf": b"%PDF guide content", "/faq.txt": b"Frequently asked questions"}
+
+
+class DocumentHandler(BaseHTTPRequestHandler):
+    downloads = 0
+
+    def do_GET(self):
+        body = DOCUMENTS.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        DocumentHandler.downloads += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", f'"{hash(body)}"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def document_server():
+    server = HTTPServer(("127.0.0.1", 0), DocumentHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    DocumentHandler.downloads = 0
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def seed(base_url, *paths):
+    return [{"url": base_url + path, "key": "Documents" + path, "category": "Guides"} for path in paths]
+
+
+def test_documents_are_streamed_to_s3_with_sidecar_and_manifest(document_server):
+    s3 = FakeS3()
+    manifest = IngestManifest(s3, BUCKET).load()
+
+    results = init_kendra.bootstrap(s3, BUCKET, seed(document_server, "/guide.pdf", "/faq.txt"), manifest=manifest)
+
+    assert results == {"Documents/guide.pdf": "uploaded", "Documents/faq.txt": "uploaded"}
+    assert s3.objects[(BUCKET, "Documents/guide.pdf")]["Body"] == DOCUMENTS["/guide.pdf"]
+    assert s3.objects[(BUCKET, "Documents/guide.pdf")]["Metadata"]["source-url"] == document_server + "/guide.pdf"
+    assert (BUCKET, metadata_key("Documents/faq.txt")) in s3.objects
+    assert sorted(manifest.pending()) == ["Documents/faq.txt", "Documents/guide.pdf"]
+    assert manifest.entries["Documents/faq.txt"]["s"] == len(DOCUMENTS["/faq.txt"])
+
+
+def test_current_documents_are_skipped_after_the_headers(document_server):
+    s3 = FakeS3()
+    documents = seed(document_server, "/guide.pdf")
+    init_kendra.bootstrap(s3, BUCKET, documents)
+    manifest = IngestManifest(s3, BUCKET).load()
+
+    results = init_kendra.bootstrap(s3, BUCKET, documents, manifest=manifest)
+
+    assert results == {"Documents/guide.pdf": "skipped"}
+    assert manifest.stats["uploads_avoided"] == 1
+    assert manifest.stats["bytes_avoided"] == len(DOCUMENTS["/guide.pdf"])
+
+
+def test_missing_and_late_documents_are_reported(document_server):
+    class Context:
+        def get_remaining_time_in_millis(self):
+            return init_kendra.MIN_REMAINING_MILLIS - 1
+
+    s3 = FakeS3()
+
+    assert init_kendra.bootstrap(s3, BUCKET, seed(document_server, "/missing.pdf")) == {"Documents/missing.pdf": "failed"}
+    assert init_kendra.bootstrap(s3, BUCKET, seed(document_server, "/guide.pdf"), context=Context()) == {"Documents/guide.pdf": "pending"}
+    assert DocumentHandler.downloads == 0
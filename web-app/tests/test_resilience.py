@@ -0,0 +1,50 @@
+import time
+
+import boto3
+import pytest
+
+from scripts import resilience
+
+
+class ExhaustedLimiter:
+    def acquire(self):
+        return False
+
+
+def half_open_breaker(name):
+    breaker = resilience.CircuitBreaker(name, failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    breaker.opened_at = time.monotonic() - 60
+    assert breaker.state == "half-open"
+    return breaker
+
+
+def test_rate_limit_timeout_does_not_take_the_half_open_trial(monkeypatch):
+    breaker = half_open_breaker("kendra")
+    monkeypatch.setitem(resilience.breakers, "kendra", breaker)
+    monkeypatch.setitem(resilience.limiters, "kendra", ExhaustedLimiter())
+    client = boto3.client("kendra", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test")
+    resilience.install(client, "kendra")
+
+    with pytest.raises(resilience.RateLimitTimeout):
+        client.retrieve(IndexId="0" * 36, QueryText="question")
+
+    #The call never reached Kendra, the next one still gets the trial
+    breaker.before_call()
+
+
+def test_half_open_breaker_rejects_calls_during_the_trial():
+    breaker = half_open_breaker("bedrock-runtime")
+    breaker.before_call()
+    with pytest.raises(resilience.CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_trial_without_outcome_expires():
+    breaker = half_open_breaker("bedrock-runtime")
+    breaker.before_call()
+    #No after-call event for the trial, it is given up after reset_timeout
+    breaker._trial_started -= 60
+    breaker.before_call()
@@ -0,0 +1,122 @@
+import time
+import types
+import threading
+
+from botocore.exceptions import ClientError
+
+from scripts.sync_scheduler import SyncScheduler
+
+
+class ConflictException(ClientError):
+    pass
+
+
+class StubKendra:
+    """
+    Kendra client stub: sync jobs run for the given number of status checks,
+    and StartDataSourceSyncJob raises the queued errors first.
+    """
+
+    exceptions = types.SimpleNamespace(ConflictException=ConflictException)
+
+    def __init__(self, running_checks=0, start_errors=()):
+        self.running_checks = running_checks
+        self.start_errors = list(start_errors)
+        self.started = []
+        self._lock = threading.Lock()
+
+    def list_data_source_sync_jobs(self, Id, IndexId, MaxResults):
+        with self._lock:
+            if self.running_checks:
+                self.running_checks -= 1
+                return {"History": [{"ExecutionId": "other-task", "Status": "SYNCING"}]}
+        return {"History": [{"ExecutionId": job_id, "Status": "SUCCEEDED"} for job_id in reversed(self.started)]}
+
+    def start_data_source_sync_job(self, Id, IndexId):
+        with self._lock:
+            if self.start_errors:
+                raise self.start_errors.pop(0)
+            self.started.append(f"job-{len(self.started) + 1}")
+            return {"ExecutionId": self.started[-1]}
+
+    def describe_index(self, Id):
+        return {"IndexStatistics": {"TextDocumentStatistics": {"IndexedTextDocumentsCount": 3}}}
+
+
+def scheduler(kendra, **kwargs):
+    return SyncScheduler(kendra, "index", "data-source", window=0.1, poll_interval=0.01, **kwargs)
+
+
+def wait_idle(sync_scheduler, timeout=5):
+    deadline = time.time() + timeout
+    while sync_scheduler._worker is not None and time.time() < deadline:
+        time.sleep(0.01)
+    assert sync_scheduler._worker is None
+
+
+def test_requests_within_the_window_start_one_job():
+    kendra = StubKendra()
+    sync_scheduler = scheduler(kendra)
+
+    for _ in range(5):
+        sync_scheduler.request()
+    wait_idle(sync_scheduler)
+
+    assert kendra.started == ["job-1"]
+    assert sync_scheduler.coalesced == 4
+    assert sync_scheduler.status()["pending_requests"] == 0
+
+
+def test_waits_for_the_running_job():
+    kendra = StubKendra(running_checks=3)
+    sync_scheduler = scheduler(kendra)
+
+    sync_scheduler.request()
+    wait_idle(sync_scheduler)
+
+    assert kendra.running_checks == 0
+    assert kendra.started == ["job-1"]
+
+
+def test_requests_are_queued_again_when_the_start_fails():
+    conflict = ConflictException({"Error": {"Code": "ConflictException", "Message": "running"}}, "StartDataSourceSyncJob")
+    throttled = ClientError({"Error": {"Code": "ThrottlingException", "Message": "slow down"}}, "StartDataSourceSyncJob")
+    kendra = StubKendra(start_errors=[conflict, throttled])
+    sync_scheduler = scheduler(kendra)
+
+    sync_scheduler.request()
+    sync_scheduler.request()
+    wait_idle(sync_scheduler)
+
+    assert kendra.started == ["job-1"]
+    assert sync_scheduler.coalesced == 1
+    #The error is cleared by the job that finally started
+    assert sync_scheduler.last_error is None
+
+
+def test_callbacks_receive_the_job_id_and_a_failing_one_is_isolated():
+    started = []
+
+    def failing(job_id):
+        raise RuntimeError("callback failed")
+
+    kendra = StubKendra()
+    sync_scheduler = scheduler(kendra, on_sync_started=[failing, started.append])
+
+    sync_scheduler.request()
+    wait_idle(sync_scheduler)
+
+    assert started == ["job-1"]
+    assert sync_scheduler.last_job_id == "job-1"
+
+
+def test_status_falls_back_to_the_last_known_one_when_kendra_throttles():
+    kendra = StubKendra()
+    sync_scheduler = scheduler(kendra)
+    assert sync_scheduler.status()["indexed_documents"] == 3
+
+    def throttled(Id):
+        raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "slow down"}}, "DescribeIndex")
+    kendra.describe_index = throttled
+
+    assert sync_scheduler.status()["indexed_documents"] == 3